@@ -3,10 +3,14 @@ Generate time series for certain words
 '''
 
 import os
+import csv
 import sys
-import nltk
+import bisect
+import numpy as np
 import pandas as pd
 import argparse
+import collections
+import scipy.sparse
 import dateutil
 import datetime
 import wordfreqs as wf
@@ -25,6 +29,19 @@ def get_settings():
                         help='Language in which the texts were written',
                         choices=wf.lang_codes.keys(), type = str.lower)
     parser.add_argument('-w', '--word', dest='words', action='append')
+    parser.add_argument('-g', '--group', dest='groups', action='append',
+                        help='''A comma-separated group of words to chart
+                        together; repeat to draw several charts in one run''')
+    parser.add_argument('--groups-file', dest='groups_file',
+                        help='File of word groups, one comma-separated group per line')
+    parser.add_argument('--counts', dest='counts_dir',
+                        help='''Output directory of wordfreqs.py; read each
+                        file's raw_freq counts instead of tokenizing it''')
+    parser.add_argument('--matrix', dest='matrix',
+                        help='''Binary (.npz) store of document counts; loaded
+                        if it exists, otherwise written after counting.
+                        Documents changed since they were stored are
+                        counted again''')
     parser.add_argument('--exact', dest='exact', action='store_true', default=False, help='Require an exact match')
     return parser.parse_args()
 
@@ -35,24 +52,235 @@ def get_words(filename, language):
     return wf.wordlist(sentences)
 
 
-def get_frequency(fd, word, exact):
-    freq = 0
-    if exact and word in fd:
-        freq = fd.freq(word)
+def read_word_counts(filename, counts_dir):
+    '''
+    Read the raw frequencies wordfreqs.py wrote for a document
+    '''
+    counts = collections.Counter()
+    try:
+        with open(wf.output_filename(counts_dir, filename)) as f:
+            for row in csv.DictReader(f, quotechar='|'):
+                if row['raw_freq']:
+                    counts[row['word']] += int(row['raw_freq'])
+    except OSError as err:
+        print(err)
+    return counts
+
+
+def read_length(filename, counts_dir, counts):
+    '''
+    Words in a document, from its wordfreqs.py stats when available
+    Otherwise the total of its counts, which lacks any stopwords removed
+    '''
+    try:
+        return int(wf.read_stats(wf.output_filename(counts_dir, filename + '_stats'))['words'])
+    except (OSError, KeyError, ValueError):
+        return sum(counts.values())
+
+
+def count_matrix(counts):
+    '''
+    Put token counts for every document in one sparse doc x term matrix
+    Columns follow the sorted vocabulary, so the tokens sharing a prefix
+    are a contiguous range of columns
+    Return the sorted vocabulary and the matrix
+    '''
+    counts = list(counts)
+    vocabulary = sorted(set(token for counter in counts for token in counter))
+    columns = {token: i for i, token in enumerate(vocabulary)}
+    rows, cols, values = list(), list(), list()
+    for row, counter in enumerate(counts):
+        for token, count in counter.items():
+            rows.append(row)
+            cols.append(columns[token])
+            values.append(count)
+    matrix = scipy.sparse.csr_matrix((values, (rows, cols)),
+                                     shape=(len(counts), len(vocabulary)))
+    return vocabulary, matrix
+
+
+def prefix_range(vocabulary, word, exact):
+    '''
+    Return the range of columns for word, or every token starting with it
+    '''
+    start = bisect.bisect_left(vocabulary, word)
+    if exact:
+        end = start + 1 if vocabulary[start:start + 1] == [word] else start
+    else:
+        end = bisect.bisect_left(vocabulary, word + '\U0010ffff', start)
+    return start, end
+
+
+def source_file(filename, settings):
+    ''' The file a document's counts are read from '''
+    if settings.counts_dir:
+        return wf.output_filename(settings.counts_dir, filename)
+    return filename
+
+
+def file_stamps(filenames, settings):
+    '''
+    Size and modification time of each document's source file,
+    (-1, -1) if it is missing
+    '''
+    stamps = list()
+    for filename in filenames:
+        try:
+            stat = os.stat(source_file(filename, settings))
+            stamps.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamps.append((-1, -1))
+    return np.array(stamps, dtype=np.int64).reshape(-1, 2)
+
+
+def count_params(settings):
+    ''' How documents were counted; stores made otherwise are not reused '''
+    if settings.counts_dir:
+        return 'counts={}'.format(os.path.abspath(settings.counts_dir))
+    return 'language={}'.format(settings.language)
+
+
+def save_matrix(filename, filenames, vocabulary, matrix, lengths, stamps, settings):
+    np.savez_compressed(filename, filenames=np.array(filenames, dtype=str),
+                        vocabulary=np.array(vocabulary, dtype=str),
+                        data=matrix.data, indices=matrix.indices,
+                        indptr=matrix.indptr, shape=matrix.shape,
+                        lengths=lengths, stamps=stamps,
+                        params=np.array(count_params(settings)))
+
+
+def load_matrix(filename):
+    '''
+    Load a store written by save_matrix
+    Return filenames, vocabulary, matrix, document lengths, file stamps
+    and counting parameters; stores from before stamps were kept get
+    stamps that match nothing
+    '''
+    store = np.load(filename)
+    matrix = scipy.sparse.csr_matrix((store['data'], store['indices'], store['indptr']),
+                                     shape=tuple(store['shape']))
+    filenames = store['filenames'].tolist()
+    if 'stamps' in store.files:
+        stamps, params = store['stamps'], str(store['params'])
+    else:
+        stamps, params = np.full((len(filenames), 2), -2, dtype=np.int64), None
+    return (filenames, store['vocabulary'].tolist(), matrix, store['lengths'],
+            stamps, params)
+
+
+def build_counts(filenames, settings):
+    '''
+    Count every document once, from wordfreqs.py output if given
+    Return vocabulary, doc x term matrix and document lengths
+    '''
+    if settings.counts_dir:
+        counts = [read_word_counts(filename, settings.counts_dir) for filename in filenames]
+        lengths = np.array([read_length(filename, settings.counts_dir, c)
+                            for filename, c in zip(filenames, counts)], dtype=float)
+        vocabulary, matrix = count_matrix(counts)
     else:
-        for token in fd:
-            if token.startswith(word):
-                freq += fd[token]
-    return freq
+        vocabulary, matrix = count_matrix(collections.Counter(get_words(filename, settings.language))
+                                          for filename in filenames)
+        lengths = np.asarray(matrix.sum(axis=1), dtype=float).ravel()
+    return vocabulary, matrix, lengths
 
 
-def relative_frequency(row, words):
+def get_counts(filenames, settings):
+    '''
+    Load counts from the --matrix store, or build them (and save the store)
+    Documents whose source file changed size or modification time since
+    they were stored are counted again; a store counted another way
+    (--counts or not, another language) is rebuilt
+    Rows follow the order of filenames
+    '''
+    stamps = file_stamps(filenames, settings)
+    if settings.matrix and os.path.isfile(settings.matrix):
+        stored, vocabulary, matrix, lengths, stored_stamps, params = load_matrix(settings.matrix)
+        if params == count_params(settings):
+            index = {filename: i for i, filename in enumerate(stored)}
+            stale = list(collections.OrderedDict.fromkeys(
+                filename for filename, stamp in zip(filenames, stamps)
+                if filename not in index or (stored_stamps[index[filename]] != stamp).any()))
+            if len(stale):
+                print('{} files new or changed since {}; counting them'.format(len(stale), settings.matrix))
+                changed = set(stale)
+                keep = [i for i, filename in enumerate(stored) if filename not in changed]
+                extra_vocabulary, extra, extra_lengths = build_counts(stale, settings)
+                stored, vocabulary, matrix, lengths = merge_counts(
+                    ([stored[i] for i in keep], vocabulary, matrix[keep], lengths[keep]),
+                    (stale, extra_vocabulary, extra, extra_lengths))
+                stored_stamps = np.concatenate([stored_stamps[keep], file_stamps(stale, settings)])
+                save_matrix(settings.matrix, stored, vocabulary, matrix, lengths,
+                            stored_stamps, settings)
+                index = {filename: i for i, filename in enumerate(stored)}
+            rows = [index[filename] for filename in filenames]
+            return vocabulary, matrix[rows], lengths[rows]
+        print('{} was counted with other settings; counting again'.format(settings.matrix))
+
+    vocabulary, matrix, lengths = build_counts(filenames, settings)
+    if settings.matrix:
+        save_matrix(settings.matrix, filenames, vocabulary, matrix, lengths, stamps, settings)
+    return vocabulary, matrix, lengths
+
+
+def merge_counts(first, second):
+    '''
+    Stack two sets of document counts over their combined vocabulary
+    '''
+    vocabulary = sorted(set(first[1]) | set(second[1]))
+    columns = {token: i for i, token in enumerate(vocabulary)}
+    matrices = list()
+    for filenames, words, matrix, lengths in [first, second]:
+        coo = matrix.tocoo()
+        remap = np.array([columns[token] for token in words], dtype=int)
+        matrices.append(scipy.sparse.csr_matrix((coo.data, (coo.row, remap[coo.col])),
+                                                shape=(matrix.shape[0], len(vocabulary))))
+    return (first[0] + second[0], vocabulary, scipy.sparse.vstack(matrices).tocsr(),
+            np.concatenate([first[3], second[3]]))
+
+
+def get_groups(settings):
+    ''' Every group of words to chart '''
+    groups = list()
+    if settings.words:
+        groups.append(settings.words)
+    for group in settings.groups or []:
+        groups.append([word.strip() for word in group.split(',') if word.strip()])
+    if settings.groups_file:
+        with open(settings.groups_file) as f:
+            for line in f:
+                group = [word.strip() for word in line.split(',') if word.strip()]
+                if group:
+                    groups.append(group)
+    return groups
+
+
+def get_frequency(matrix, vocabulary, word, exact):
+    '''
+    Raw frequency of word (or its prefix) in every document
+    '''
+    start, end = prefix_range(vocabulary, word, exact)
+    return np.asarray(matrix[:, start:end].sum(axis=1)).ravel()
+
+
+def chart_words(dates, matrix, vocabulary, lengths, words, settings):
+    '''
+    Plot the relative frequency over time of a group of words
+    '''
+    df = pd.DataFrame(index=dates)
+    # get relative frequency for every word
     for word in words:
-        if len(row['words']):
-            row[word] = row[word] / len(row['words'])
-        else:
-            row[word] = 0
-    return row
+        freq = get_frequency(matrix, vocabulary, word, settings.exact)
+        df[word] = np.divide(freq, lengths, out=np.zeros(len(lengths)),
+                             where=lengths > 0)
+
+    # Resample for monthly values
+    tsres = df[words].resample('M').median().interpolate('time')
+    f = plt.figure(figsize=(30, 10))
+    tsres.plot(style=['-.', '--', '-', ':'], linewidth=2, color='k', ax=f.gca())
+    plt.savefig(os.path.join(settings.outputdir, '_'.join(words)), pad_inches=.25, dpi=600)
+    plt.close(f)
+
 
 def main():
     settings = get_settings()
@@ -69,21 +297,10 @@ def main():
     # Make dates the index
     df.set_index(['date'], inplace=True)
     df.sort_index(inplace=True)
-    df['words'] = df['filename'].apply(get_words, args=(settings.language,))
-    df['fd'] = df['words'].apply(nltk.FreqDist)
-
-    # get raw frequency for every word
-    for word in settings.words:
-        df[word] = df['fd'].apply(get_frequency, args=(word, settings.exact))
+    vocabulary, matrix, lengths = get_counts(df['filename'].tolist(), settings)
 
-    # Convert to relative frequencies by row
-    df = df.apply(relative_frequency, axis=1, args=(settings.words,))
-
-    # Resample for monthly values
-    tsres = df[settings.words].resample('M').median().interpolate('time')
-    f = plt.figure(figsize=(30, 10))
-    tsres.plot(style=['-.', '--', '-', ':'], linewidth=2, color='k', ax=f.gca())
-    plt.savefig(os.path.join(settings.outputdir, '_'.join(settings.words)), pad_inches=.25, dpi=600)
+    for words in get_groups(settings):
+        chart_words(df.index, matrix, vocabulary, lengths, words, settings)
 
 
 if __name__ == '__main__':
@@ -22,23 +22,37 @@ def get_settings():
     return parser.parse_args()
 
 
+def top_values(inputfile, column, number, chunksize=100000):
+    '''
+    Stream the CSV in chunks, keeping only the rows with the top values
+    Memory stays proportional to number, not to the size of the file
+    '''
+    top = None
+    for chunk in pd.read_csv(inputfile, usecols=['word', column],
+                             chunksize=chunksize, error_bad_lines=False):
+        chunk = chunk.dropna(subset=[column, 'word'])
+        if top is not None:
+            chunk = pd.concat([top, chunk])
+        top = chunk.nlargest(number, column)
+    return top
+
+
 def main():
     settings = get_settings()
     if not os.path.isdir(settings.outputdir):
         os.makedirs(settings.outputdir)
-    df = pd.read_csv(settings.inputfile, error_bad_lines=False)
 
     # Raw frequency bar charts
-    df.sort_values(settings.column, inplace=True, ascending=False)
-    df.dropna(subset=[settings.column, 'word'], inplace=True)
+    if settings.number:
+        df = top_values(settings.inputfile, settings.column, settings.number)
+    else:
+        df = pd.read_csv(settings.inputfile, error_bad_lines=False)
+        df.dropna(subset=[settings.column, 'word'], inplace=True)
+        df.sort_values(settings.column, inplace=True, ascending=False)
     df['word'] = df['word'].apply(str.strip)
     basename = os.path.splitext(os.path.basename(settings.inputfile))[0]
     filename = os.path.join(settings.outputdir, "{}_{}_{}".format(basename, settings.number, settings.column + '.png'))
-    if settings.number:
-        data = df.head(settings.number)
-    else:
-        data = df
-    gc.barplot(df=data, x='word', y=settings.column, filename=filename, xlabel=settings.xlabel, ylabel=settings.ylabel, title=settings.title, show=settings.show)
+    gc.barplot(df=df, x='word', y=settings.column, filename=filename, xlabel=settings.xlabel, ylabel=settings.ylabel, title=settings.title, show=settings.show)
 
 
 if __name__ == '__main__':
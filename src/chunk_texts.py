@@ -5,9 +5,19 @@ Uses rough word counts; nothing in this world is perfect
 Mike Widner <mikewidner@stanford.edu>
 '''
 import os
+import re
+import csv
 import sys
+import mmap
+import itertools
 import argparse
 import metadata
+from concurrent.futures import ProcessPoolExecutor
+
+# Runs of whitespace in UTF-8, matching what str.split() splits on
+whitespace = re.compile(rb'(?:[\t\n\x0b\x0c\r\x1c-\x1f ]|\xc2[\x85\xa0]|'
+                        rb'\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|'
+                        rb'\xe2\x81\x9f|\xe3\x80\x80)+')
 
 
 def parse_options():
@@ -15,8 +25,8 @@ def parse_options():
         description='Chunk files into different sizes')
     parser.add_argument('-i', dest='input', required=True,
                         help='Input file of metadata as CSV')
-    parser.add_argument('-o', dest='output', required=True,
-                        help='Output file for results')
+    parser.add_argument('-o', dest='output',
+                        help='Output directory for chunk files')
     parser.add_argument('-v', '--verbose', dest='verbose',
                         action='store_true', help='Verbose output')
     parser.add_argument('-m', '--min-words', dest='min_words',
@@ -25,7 +35,21 @@ def parse_options():
     parser.add_argument('-s', '--size', dest='chunk_size', default=500,
                         type=int,
                         help='Desired number of words in a chunk')
-    return parser.parse_args()
+    parser.add_argument('-j', '--jobs', dest='jobs', default=None, type=int,
+                        help='Number of worker processes (default: all CPUs)')
+    parser.add_argument('--manifest', dest='manifest',
+                        help='''CSV file to record the byte range of every
+                        chunk within its source document''')
+    parser.add_argument('--index-only', dest='index_only',
+                        action='store_true',
+                        help='''Only write the --manifest chunk index, not
+                        the chunk files; export it with chunks2mallet.py''')
+    settings = parser.parse_args()
+    if settings.index_only and not settings.manifest:
+        parser.error('--index-only requires --manifest')
+    if not settings.index_only and not settings.output:
+        parser.error('-o is required unless using --index-only')
+    return settings
 
 
 def generate_filepaths(metadata_file, output_dir):
@@ -38,56 +62,120 @@ def generate_filepaths(metadata_file, output_dir):
     return data
 
 
-def read_text(filename):
-    text = None
+def open_text(filename):
+    '''
+    Memory-map a file for reading
+    Return the open file and its map, or None if it cannot be read
+    '''
     try:
-        fh = open(filename, 'r')
+        fh = open(filename, 'rb')
     except FileNotFoundError as err:
         print("Could not read {}: {}".format(filename, err))
+        return None
     except IsADirectoryError as err:
         print(err)
-    else:
-        text = fh.read()
+        return None
+    try:
+        return fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return fh, b''  # empty files can't be mapped
+
+
+def chunk_boundaries(buf, chunk_size, min_length):
+    '''
+    Scan a buffer of UTF-8 text for chunks of chunk_size words
+    A final chunk shorter than min_length joins the one before it
+    Return list of (start, end, words) byte ranges
+    '''
+    boundaries = list()
+    start = end = 0
+    words = 0
+    position = 0
+    gaps = ((match.start(), match.end())
+            for match in whitespace.finditer(buf))
+    for gap_start, gap_end in itertools.chain(gaps, [(len(buf), len(buf))]):
+        if gap_start > position:
+            if words == 0:
+                start = position
+            words += 1
+            end = gap_start
+            if words >= chunk_size:
+                boundaries.append((start, end, words))
+                words = 0
+        position = gap_end
+    if (words < min_length and len(boundaries) > 0):
+        last_start, last_end, last_words = boundaries.pop()
+        boundaries.append((last_start, end, last_words + words))
+    elif (words):
+        boundaries.append((start, end, words))
+    return boundaries
+
+
+def chunk_text(buf, start, end):
+    '''
+    Return the words of a chunk as a single line of text
+    '''
+    text = buf[start:end].decode('utf-8', errors='replace')
+    return ' '.join(text.split())
+
+
+def chunk_file(filename, output_path, chunk_size, min_length):
+    '''
+    Write each chunk of a document to its own file in output_path
+    With no output_path, only find the chunks
+    Return manifest rows for the chunks
+    '''
+    opened = open_text(filename)
+    if opened is None:
+        return []
+    fh, buf = opened
+    rows = list()
+    try:
+        for i, (start, end, words) in enumerate(
+                chunk_boundaries(buf, chunk_size, min_length)):
+            if output_path is not None:
+                with open(output_path + '/' + str(i), 'w',
+                          buffering=1 << 20) as out:
+                    out.write(chunk_text(buf, start, end) + "\n")
+            rows.append({'filename': filename, 'chunk': i, 'start': start,
+                         'end': end, 'words': words})
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
         fh.close()
-    return text
-
-
-def chunk_text(words, chunk_size, min_length):
-    chunk_list = []
-    chunk = []
-    i = 0
-    words.reverse()  # because we're popping
-    while words:
-        word = words.pop()
-        chunk.append(word)
-        i += 1
-        if i >= chunk_size:
-            chunk_list.append(chunk)
-            chunk = []
-            i = 0
-    if (len(chunk) < min_length and len(chunk_list) > 0):
-        chunk_list[len(chunk_list) - 1].extend(chunk)
-    elif (chunk):
-        chunk_list.append(chunk)
-    return(chunk_list)
+    return rows
+
+
+def write_manifest(filename, rows):
+    with open(filename, 'w') as f:
+        csvfile = csv.DictWriter(f, quotechar='|',
+                                 fieldnames=['filename', 'chunk', 'start',
+                                             'end', 'words'])
+        csvfile.writeheader()
+        csvfile.writerows(rows)
 
 
 def main():
     settings = parse_options()
-    metadata = generate_filepaths(settings.input, settings.output)
-    for row in metadata:
-        text = read_text(row['filename'])
-        if text is None:
-            continue
-        chunks = chunk_text(text.split(), settings.chunk_size,
-                            settings.min_words)
-        i = 0
-        for chunk in chunks:
-            fh = open(row['output_path'] + '/' + str(i), "w")
-            fh.write(' '.join(chunk))
-            fh.write("\n")
-            i += 1
-            fh.close()
+    if settings.index_only:
+        data = metadata.read_csv(settings.input)
+        for row in data:
+            row['output_path'] = None
+    else:
+        data = generate_filepaths(settings.input, settings.output)
+    manifest = list()
+    with ProcessPoolExecutor(max_workers=settings.jobs) as executor:
+        jobs = [executor.submit(chunk_file, row['filename'],
+                                row['output_path'], settings.chunk_size,
+                                settings.min_words)
+                for row in data]
+        for job in jobs:
+            rows = job.result()
+            if settings.verbose and len(rows):
+                print('{}: {} chunks'.format(rows[0]['filename'], len(rows)))
+            manifest.extend(rows)
+    if settings.manifest:
+        write_manifest(settings.manifest, manifest)
 
 
 if __name__ == '__main__':
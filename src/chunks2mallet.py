@@ -0,0 +1,81 @@
+'''
+Export a chunk index from chunk_texts.py as a single MALLET instance file
+Each chunk is read straight from its byte range in the original text,
+so no chunk files are needed; re-chunk with chunk_texts.py --index-only
+
+Writes one line per chunk: <document/chunk> <document> <text>
+Import with: mallet import-file --input chunks.txt --keep-sequence ...
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+import csv
+import sys
+import mmap
+import argparse
+import itertools
+import chunk_texts
+from urllib.parse import quote
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        description='Export indexed chunks as a MALLET instance file')
+    parser.add_argument('-i', dest='input', required=True,
+                        help='Chunk index CSV written by chunk_texts.py')
+    parser.add_argument('-o', dest='output', required=True,
+                        help='Output file of MALLET instances')
+    return parser.parse_args()
+
+
+def read_index(filename):
+    '''
+    Stream rows of the chunk index, grouped by document
+    '''
+    with open(filename) as f:
+        rows = csv.DictReader(f, quotechar='|')
+        for document, chunks in itertools.groupby(
+                rows, key=lambda row: row['filename']):
+            yield document, list(chunks)
+
+
+def chunk_id(document, chunk):
+    '''
+    MALLET instance names can't contain whitespace
+    mallet2graph.split_doc_chunk unquotes them again
+    '''
+    return quote(document, safe='/') + '/' + str(chunk)
+
+
+def export_chunks(index, out):
+    '''
+    Write every chunk in the index as one line of out
+    '''
+    for document, chunks in index:
+        opened = chunk_texts.open_text(document)
+        if opened is None:
+            continue
+        fh, buf = opened
+        try:
+            label = quote(document, safe='/')
+            for row in chunks:
+                text = chunk_texts.chunk_text(buf, int(row['start']),
+                                              int(row['end']))
+                out.write('{} {} {}\n'.format(chunk_id(document, row['chunk']),
+                                              label, text))
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+            fh.close()
+
+
+def main():
+    settings = parse_options()
+    with open(settings.output, 'w', buffering=1 << 20) as out:
+        export_chunks(read_index(settings.input), out)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 0):
+        print("This script requires Python 3")
+        exit(-1)
+    main()
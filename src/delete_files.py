@@ -13,45 +13,113 @@ settings = None
 def get_settings():
   ''' Return command-line settings '''
   parser = argparse.ArgumentParser(description='Delete files in corpus not listed in metadata')
-  parser.add_argument('-i', dest='input', required=True, help='Input CSV of metadata describing files')
+  parser.add_argument('-i', dest='input', help='Input CSV of metadata describing files')
   parser.add_argument('-t', '--test', dest='test', action='store_true', help='Do a test run; only list files to be deleted.')
-  return parser.parse_args()
+  parser.add_argument('-m', '--manifest', dest='manifest', help='Write the paths to be deleted to this file, one per line')
+  parser.add_argument('-r', '--replay', dest='replay', help='Delete the paths listed in a manifest from an earlier test run')
+  settings = parser.parse_args()
+  if not settings.input and not settings.replay:
+    parser.error('one of -i or -r/--replay is required')
+  return settings
+
+def is_cwd(directory):
+  return os.path.abspath(directory) == os.getcwd()
+
+def top_directories(directories):
+  '''
+  Reduce a list of directories to those not inside another one,
+  so each part of the tree is walked once
+  Files listed without a directory, or directly in the current
+  directory, never make the current directory a root to delete from
+  '''
+  roots = list()
+  directories = set(os.path.normpath(d) for d in directories if len(d))
+  for directory in sorted(directories, key=lambda d: d.split(os.sep)):
+    if is_cwd(directory):
+      print('Not walking the current directory {}'.format(directory))
+      continue
+    if not roots or not directory.startswith(roots[-1].rstrip(os.sep) + os.sep):
+      roots.append(directory)
+  return roots
+
+def find_garbage(roots, keep):
+  '''
+  Walk each root bottom-up
+  Return files not in keep, and directories that would be left empty
+  '''
+  files = list()
+  directories = list()
+  empty = set()
+  for basedir in roots:
+    for root, subdirs, filenames in os.walk(basedir, topdown=False):
+      remaining = 0
+      for filename in filenames:
+        path = os.path.normpath(os.path.join(root, filename))
+        # Note: Mac OS X stores files as fully decomposed unicode
+        # whereas our metadata strings are 'normal form composed'
+        # @see: http://stackoverflow.com/questions/16467479/normalizing-unicode
+        # @see: http://apple.stackexchange.com/questions/10476/how-to-enter-special-characters-so-that-bash-terminal-understands-them
+        if unicodedata.normalize('NFC', path) in keep:
+          remaining += 1
+        else:
+          files.append(path)
+      # subdirectories were visited first, so we know which will be removed
+      root = os.path.normpath(root)
+      remaining += sum(1 for subdir in subdirs if os.path.normpath(os.path.join(root, subdir)) not in empty)
+      if not remaining and not is_cwd(root):
+        directories.append(root)
+        empty.add(root)
+  return files, directories
+
+def remove_paths(paths):
+  '''
+  Delete files and (empty) directories, in the order given
+  '''
+  for path in paths:
+    try:
+      if os.path.isdir(path) and not os.path.islink(path):
+        os.rmdir(path)
+      else:
+        os.remove(path)
+      print('Removing {}'.format(path))
+    except OSError as err:
+      print('Cannot remove {}: {}'.format(path, err))
+
+def write_manifest(filename, paths):
+  with open(filename, 'w', encoding='utf-8') as f:
+    for path in paths:
+      f.write(path + '\n')
+
+def read_manifest(filename):
+  with open(filename, encoding='utf-8') as f:
+    return [line.rstrip('\n') for line in f if len(line.strip())]
 
 def delete_files(md):
   directories = list()
   all_files = list()
   for row in md:
     directories.append(os.path.dirname(row['filename']))
-    all_files.append(row['filename'])
-  directories = frozenset(directories)
+    all_files.append(unicodedata.normalize('NFC', os.path.normpath(row['filename'])))
   all_files = frozenset(all_files)
 
-  for basedir in directories:
-    for root, subdirs, files in os.walk(basedir):
-      for filename in files:
-        # Note: Mac OS X stores files as fully decomposed unicode
-        # whereas our metadata strings are 'normal form composed'
-        # @see: http://stackoverflow.com/questions/16467479/normalizing-unicode
-        # @see: http://apple.stackexchange.com/questions/10476/how-to-enter-special-characters-so-that-bash-terminal-understands-them
-        path = unicodedata.normalize('NFC', os.path.join(root, filename))
-        if path not in all_files:
-          if settings.test:
-            print(path)
-          else:
-            print('Removing {}'.format(path))
-            os.remove(path)
-    if not os.listdir(root):
-      # remove empty directories
-      if settings.test:
-        print(root)
-      else:
-        os.rmdir(root)
+  files, empty_dirs = find_garbage(top_directories(directories), all_files)
+  paths = files + empty_dirs
+  if settings.manifest:
+    write_manifest(settings.manifest, paths)
+  if settings.test:
+    for path in paths:
+      print(path)
+  else:
+    remove_paths(paths)
 
 def main():
   global settings
   settings = get_settings()
-  md = metadata.read_csv(settings.input)
-  delete_files(md)
+  if settings.replay:
+    remove_paths(read_manifest(settings.replay))
+  else:
+    md = metadata.read_csv(settings.input)
+    delete_files(md)
 
 if __name__ == '__main__':
   if sys.version_info < (3,0):
@@ -1,40 +1,63 @@
 '''
 Download speeches and metadata from Elysee.fr
 
+Result listings are followed and speeches downloaded concurrently
+through scraper.Fetcher; pages are cached, so re-running only
+downloads what changed.
+
 '''
 
-import re
-import csv
-import urllib.request
+import os
+import hashlib
 import argparse
+from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
+import metadata
+import scraper
 
 def parse_arguments():
   parser = argparse.ArgumentParser(description='Download metadata and speech text from Elyssee.fr')
-  parser.add_argument('-u', '--url', help='URL to scrape')
+  parser.add_argument('-u', '--url', default='http://www.elysee.fr/declarations', help='URL to scrape')
   parser.add_argument('-o', dest='output_dir', required=True,
                      help='Output directory')
+  parser.add_argument('--cache-dir', dest='cache_dir', help='HTTP cache directory; defaults to .cache in the output directory')
+  parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=8, help='Number of pages to fetch at once')
+  parser.add_argument('--per-host', dest='per_host', type=int, default=2, help='Most requests in flight to one host')
   args = parser.parse_args()
   return args
 
-def get_results(url):
+def get_text(element):
+  return '' if element is None else element.get_text(' ', strip=True)
+
+def parse_listing(page):
   '''
-  Get the results listing for downloading actual pages
+  Return links to speeches and to other pages of a results listing
   '''
-  # li class="page-next" has link to next page
-  # gone on last page
   # a class="main-link" points to the page content itself
-  page = urllib.request.urlopen(url)
-  soup = BeautifulSoup(page.read(), 'html.parser')
-  print(soup)
-  for block in soup.find_all('div', attrs={'class': 'block-content'}):
-    date = block.find('div', attrs={'class': 'date'}).content
-    if date.startswith('Publié le '):
-      date = date[:10]
-    themes = block.find('div', attrs={'class': 'themes'}).content
-    print(date, themes)
-
-def get_page():
+  # li class="page-next" has link to next page, gone on last page;
+  # numbered pages are li elements with page classes too
+  soup = BeautifulSoup(page.content, 'html.parser')
+  speeches = [urljoin(page.url, a['href'])
+              for a in soup.find_all('a', attrs={'class': 'main-link'}) if a.has_attr('href')]
+  pages = [a['href'] for li in soup.find_all('li')
+           if any(c.startswith('page') for c in li.get('class', []))
+           for a in li.find_all('a') if a.has_attr('href')]
+  return speeches, pages
+
+def get_results(fetcher, url):
+  '''
+  Get the results listing for downloading actual pages
+  Speeches are fetched as soon as they are found
+  '''
+  seen = set()
+  futures = list()
+  for speech in fetcher.crawl([url], parse_listing):
+    if speech not in seen:
+      seen.add(speech)
+      futures.append(fetcher.submit(speech))
+  return [future.result() for future in futures]
+
+def get_page(page):
   '''
   Get the text and metadata
   '''
@@ -42,15 +65,57 @@ def get_page():
   #   span.article-date
   #   div.themes
   #   p
-  pass
+  soup = BeautifulSoup(page.content, 'html.parser')
+  article = soup.find('div', attrs={'class': 'article'}) or soup
+  text = article.find('div', attrs={'class': 'text'}) or article
+  date = get_text(text.find('span', attrs={'class': 'article-date'}))
+  if date.startswith('Publié le '):
+    date = date[len('Publié le '):]
+  return {
+    'url': page.url,
+    'title': get_text(soup.find('h1')),
+    'date': date,
+    'themes': get_text(text.find('div', attrs={'class': 'themes'})),
+    'text': '\n'.join(get_text(p) for p in text.find_all('p')),
+  }
 
+def speech_filename(url):
+  '''
+  Name the text file after the last part of the URL path, plus a short
+  hash of the whole URL: speeches under different paths share slugs
+  '''
+  name = os.path.basename(urlparse(url).path.rstrip('/')) or 'index'
+  digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+  return '{}-{}.txt'.format(os.path.splitext(name)[0], digest)
 
-def write_results():
-  pass
+def write_results(speeches, output_dir):
+  '''
+  Write each speech to a text file and their metadata to metadata.csv
+  '''
+  os.makedirs(output_dir, exist_ok=True)
+  rows = list()
+  for speech in sorted(speeches, key=lambda s: s['url']):
+    filename = speech_filename(speech['url'])
+    with open(os.path.join(output_dir, filename), 'w') as f:
+      f.write(speech['text'] + '\n')
+    rows.append({
+      'filename': filename,
+      'url': speech['url'],
+      'title': speech['title'],
+      'date': speech['date'],
+      'themes': speech['themes'],
+    })
+  metadata.write_csv(os.path.join(output_dir, 'metadata.csv'), rows)
 
 def main():
   args = parse_arguments()
-  get_results(args.url)
+  cache_dir = args.cache_dir or os.path.join(args.output_dir, '.cache')
+  with scraper.Fetcher(cache_dir, jobs=args.jobs, per_host=args.per_host) as fetcher:
+    pages = get_results(fetcher, args.url)
+    speeches = [get_page(page) for page in pages]
+    print('{} speeches: {} downloaded, {} unchanged'.format(
+      len(speeches), fetcher.stats['downloaded'], fetcher.stats['revalidated']))
+  write_results(speeches, args.output_dir)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,14 @@
 '''
 Read data from Facebook posts for given user(s)
 
+Feeds are crawled in parallel. Post details and followed links are
+fetched concurrently through one pooled HTTP session, with retries and
+a bounded number of requests in flight, and each link is downloaded
+once no matter how many posts or feeds share it.
+
+Use --graph-url to point at another Graph API server, e.g. the mock in
+mock_graph_api.py for offline benchmarking.
+
 Mike Widner <mikewidner@stanford.edu>
 '''
 
@@ -8,10 +16,14 @@ import os
 import re
 import csv
 import argparse
-import facebook
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 
 settings = None
+shared_statuses = ['shared_story', 'mobile_status_update', 'created_note']
 
 def get_settings():
   parser = argparse.ArgumentParser(description='Extract data from Facebook feeds')
@@ -21,51 +33,117 @@ def get_settings():
   parser.add_argument('-s', '--app-secret', required=True, dest='app_secret', help='The application secret')
   parser.add_argument('-o', '--outputdir', required=True, dest='outputdir', help='Output directory to store results')
   parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', required=False, help='Provide verbose output')
+  parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=16, help='Most HTTP requests in flight at once')
+  parser.add_argument('--retries', dest='retries', type=int, default=3, help='Times to retry a failed request')
+  parser.add_argument('--timeout', dest='timeout', type=float, default=30, help='Seconds to wait for a response')
+  parser.add_argument('--graph-url', dest='graph_url', default='https://graph.facebook.com/', help='Base URL of the Graph API')
   return parser.parse_args()
 
-def get_facebook_graph(app_id, app_secret):
-  graph = facebook.GraphAPI()
-  access_token = graph.get_app_access_token(app_id, app_secret)
-  graph = facebook.GraphAPI(access_token=access_token)
+def get_session(pool_size, retries):
+  '''
+  Return a session that keeps up to pool_size connections per host
+  open and retries failed requests with backoff
+  '''
+  retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+  session = requests.Session()
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+class Graph(object):
+  '''
+  Minimal Graph API client over a shared session
+  '''
+  def __init__(self, session, url, timeout):
+    self.session = session
+    self.url = url
+    self.timeout = timeout
+    self.access_token = None
+
+  def get(self, url, params=None):
+    r = self.session.get(url, params=params, timeout=self.timeout)
+    r.raise_for_status()
+    return r.json()
+
+  def get_object(self, path):
+    return self.get(self.url + path, {'access_token': self.access_token})
+
+  def authenticate(self, app_id, app_secret):
+    self.access_token = self.get(self.url + 'oauth/access_token', {
+      'grant_type': 'client_credentials',
+      'client_id': app_id,
+      'client_secret': app_secret,
+    })['access_token']
+
+def get_facebook_graph(session, app_id, app_secret):
+  graph = Graph(session, settings.graph_url, settings.timeout)
+  graph.authenticate(app_id, app_secret)
   return graph
 
 def write_followed_link(link, data):
   filename = re.sub(r'^https?:\/\/', '', link) + '.html'
   outfile = os.path.join(settings.outputdir, filename)
-  if not os.path.isdir(os.path.dirname(outfile)):
-    os.makedirs(os.path.dirname(outfile))
+  os.makedirs(os.path.dirname(outfile), exist_ok=True)
   with open(outfile, 'w') as f:
     f.write(data)
 
-def get_facebook_data(graph, feed_url):
-  data = list()
-  first_page = True
-  while(True):
-    if first_page:
-      posts = graph.get_object(feed_url)
-      first_page = False
-    else:
-      try:
-        posts = requests.get(posts['paging']['next']).json()
-      except KeyError:
+class LinkFollower(object):
+  '''
+  Download each linked page once, across all feeds
+  '''
+  def __init__(self, session, executor):
+    self.session = session
+    self.executor = executor
+    self.seen = set()
+    self.lock = threading.Lock()
+
+  def follow(self, link):
+    with self.lock:
+      if link in self.seen:
+        return None
+      self.seen.add(link)
+    return self.executor.submit(self.download, link)
+
+  def download(self, link):
+    try:
+      r = self.session.get(link, timeout=settings.timeout)
+      r.encoding = 'utf-8'
+      write_followed_link(link, r.text)
+    except (requests.RequestException, OSError):
+      # Couldn't retrieve the link, don't sweat it
+      pass
+
+def get_pages(graph, feed_url):
+  '''
+  Yield each page of a feed, following the paging links
+  '''
+  posts = graph.get_object(feed_url)
+  while True:
+    yield posts
+    try:
+      posts = graph.get(posts['paging']['next'])
+    except KeyError:
       # No more pages
-       break
-      for post in posts['data']:
-        try:
-          if ('status_type' in post) and (post['status_type'] in ['shared_story', 'mobile_status_update', 'created_note']):
-            data.append(graph.get_object(post['id']))
-            if 'link' in post:
-              try:
-                r = requests.get(post['link'])
-                r.encoding = 'utf-8'
-                write_followed_link(post['link'], r.text)
-              except:
-                # Couldn't retrieve the link, don't sweat it
-                pass
-        except KeyError:
-          pass  # just keep swimming
+      break
 
-  return data
+def get_facebook_data(graph, feed_url, executor, links):
+  '''
+  Return full details of the feed's shared posts, in feed order
+  Details are fetched on executor; links are queued with links
+  '''
+  details = list()
+  downloads = list()
+  for posts in get_pages(graph, feed_url):
+    for post in posts.get('data', []):
+      if post.get('status_type') in shared_statuses and 'id' in post:
+        details.append(executor.submit(graph.get_object, post['id']))
+        if 'link' in post:
+          downloads.append(links.follow(post['link']))
+  for download in downloads:
+    if download is not None:
+      download.result()
+  return [future.result() for future in details]
 
 def generate_header(data):
   return ['id', 'created_time', 'message', 'link']
@@ -73,7 +151,7 @@ def generate_header(data):
 def write_results(feed_id, data, outputdir):
   outfile = os.path.join(outputdir, feed_id + '.csv')
   if not os.path.isdir(outputdir):
-    os.makedirs(outputdir)
+    os.makedirs(outputdir, exist_ok=True)
   with open(outfile, 'w') as f:
     csvfile = csv.writer(f, quotechar='|')
     keys = generate_header(data)
@@ -87,13 +165,23 @@ def write_results(feed_id, data, outputdir):
           row.append('')
       csvfile.writerow(row)
 
+def process_feed(graph, feed_id, executor, links):
+  data = get_facebook_data(graph, feed_id + '/feed', executor, links)
+  write_results(feed_id, data, settings.outputdir)
+  if settings.verbose:
+    print('{}: {} posts'.format(feed_id, len(data)))
+
 def main():
   global settings
   settings = get_settings()
-  graph = get_facebook_graph(settings.app_id, settings.app_secret)
-  for feed_id in settings.feed:
-    data = get_facebook_data(graph, feed_id + '/feed')
-    write_results(feed_id, data, settings.outputdir)
+  session = get_session(settings.jobs, settings.retries)
+  graph = get_facebook_graph(session, settings.app_id, settings.app_secret)
+  with ThreadPoolExecutor(max_workers=settings.jobs) as executor, \
+      ThreadPoolExecutor(max_workers=len(settings.feed)) as feeds:
+    links = LinkFollower(session, executor)
+    futures = [feeds.submit(process_feed, graph, feed_id, executor, links) for feed_id in settings.feed]
+    for future in futures:
+      future.result()
 
 if __name__ == "__main__":
   main()
@@ -0,0 +1,99 @@
+'''
+Serve a directory of fixture pages over HTTP, for testing scrapers offline
+
+Responses carry ETag and Last-Modified headers and conditional requests
+get 304 Not Modified, like a real site, so scraper's cache can be
+checked: a second scrape should download nothing, and touching or
+editing a fixture should download only that page.
+
+  python fixture_server.py -d ../tests/fixtures/elysee -p 8001 -v
+  python elysee.py -u http://localhost:8001/declarations/ -o /tmp/elysee
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+settings = None
+
+def get_settings():
+  parser = argparse.ArgumentParser(description='Serve fixture pages with cache validators')
+  parser.add_argument('-d', '--dir', dest='directory', required=True, help='Directory of fixtures to serve')
+  parser.add_argument('-p', '--port', dest='port', type=int, default=8001, help='Port to listen on')
+  parser.add_argument('--latency', dest='latency', type=float, default=0, help='Milliseconds to wait before each response')
+  parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='Log every request')
+  return parser.parse_args()
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'  # keep connections open for pooling clients
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, directory=settings.directory, **kwargs)
+
+  def not_modified(self, etag, mtime):
+    if 'If-None-Match' in self.headers:
+      return self.headers['If-None-Match'] == etag
+    if 'If-Modified-Since' in self.headers:
+      try:
+        since = parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp()
+      except (TypeError, ValueError):
+        return False
+      return int(mtime) <= since
+    return False
+
+  def do_GET(self):
+    if settings.latency:
+      time.sleep(settings.latency / 1000)
+    path = self.translate_path(self.path)
+    if os.path.isdir(path):
+      path = os.path.join(path, 'index.html')
+    if not os.path.isfile(path):
+      self.send_error(404)
+      return
+    with open(path, 'rb') as f:
+      body = f.read()
+    mtime = os.path.getmtime(path)
+    etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+    if self.not_modified(etag, mtime):
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-Type', (mimetypes.guess_type(path)[0] or 'text/html') + '; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('ETag', etag)
+    self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    if settings.verbose:
+      super().log_message(format, *args)
+
+class FixtureServer(ThreadingHTTPServer):
+  request_queue_size = 128
+
+def main():
+  global settings
+  settings = get_settings()
+  server = FixtureServer(('localhost', settings.port), FixtureHandler)
+  print('Serving {} on http://localhost:{}/'.format(settings.directory, settings.port))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    server.server_close()
+
+if __name__ == "__main__":
+  if sys.version_info[0] != 3:
+    print("This program requires Python 3.")
+    exit(-1)
+  main()
@@ -1,22 +1,45 @@
 '''
 Download tweets and metadata from given accounts
 
+Accounts are fetched concurrently, within the API rate limit, and all
+rows go through one buffered CSV writer. Progress for each account is
+checkpointed (since_id for the newest tweet written, max_id for where
+the backfill of older tweets continues), so a rerun only fetches
+tweets it doesn't have yet; tweets whose id_str is already in the
+output are never written twice.
+
+With --record, the raw tweets fetched are saved per account; --replay
+serves those recordings in place of the Twitter API, for working
+offline.
+
 2015, Mike Widner <mikewidner@stanford.edu>
 '''
 
 import os
 import csv
 import sys
+import json
+import time
 import tweepy
 import argparse
+import threading
+import collections
 import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+PAGE_SIZE = 200  # most tweets user_timeline returns per request
 
 def get_options():
   parser = argparse.ArgumentParser(description='Extract data from Twitter feeds')
   parser.add_argument('-s', '--screenames', dest='screen_names', required=True, help='List of Twitter screen_names to download tweets')
   parser.add_argument('-c', '--config', dest='config', required=True, help='Configuration settings ini')
   parser.add_argument('-o', '--output', dest='output', required=True, help='Output file for results')
-  parser.add_argument('-n', '--num', dest='num_tweets', default = 50, help = 'Number of tweets to download per user')
+  parser.add_argument('-n', '--num', dest='num_tweets', type=int, default = 50, help = 'Number of tweets to download per user, counting back from the first run')
+  parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4, help='Number of accounts to fetch at once')
+  parser.add_argument('--rate', dest='rate', type=int, default=900, help='Most requests to make in any 15 minutes')
+  parser.add_argument('--checkpoint', dest='checkpoint', help='Checkpoint file; defaults to the output file plus .checkpoint.json')
+  parser.add_argument('--record', dest='record', help='Directory to save the raw tweets fetched, one file per account')
+  parser.add_argument('--replay', dest='replay', help='Directory of recorded tweets to serve instead of the Twitter API')
   return parser.parse_args()
 
 def get_screen_names(filename):
@@ -46,34 +69,248 @@ def twitter_authenticate(login):
   api = tweepy.API(auth_handler = auth, wait_on_rate_limit = True, wait_on_rate_limit_notify = True)
   return api
 
-def write_tweets(filename, rows):
-  if not os.path.isfile(filename):
-    csvfile = open(filename, 'w')
-  else:
-    csvfile = open(filename, 'a')
-  tweet_data = csv.writer(csvfile, quotechar='|', quoting=csv.QUOTE_ALL)
-  tweet_data.writerows(rows)
-
-def get_tweets(api, screen_name, count, columns):
-  rows = list()
-  for tweet in tweepy.Cursor(api.user_timeline, id=screen_name).items(int(count)):
-    row = [screen_name]
-    for column in columns:
-      row.append(getattr(tweet, column))
-    rows.append(row)
-  return rows
+def recording_filename(directory, screen_name):
+  return os.path.join(directory, screen_name + '.jsonl')
+
+class ReplayAPI(object):
+  '''
+  Stand-in for tweepy.API that serves tweets saved with --record
+  Answers user_timeline the way Twitter does: newest first, at most
+  count tweets, with ids above since_id and no greater than max_id
+  '''
+  def __init__(self, directory):
+    self.directory = directory
+    self.timelines = dict()
+    self.lock = threading.Lock()
+
+  def timeline(self, screen_name):
+    with self.lock:
+      if screen_name not in self.timelines:
+        tweets = dict()
+        filename = recording_filename(self.directory, screen_name)
+        if os.path.isfile(filename):
+          with open(filename) as f:
+            for line in f:
+              tweet = tweepy.models.Status.parse(None, json.loads(line))
+              tweets[tweet.id] = tweet
+        self.timelines[screen_name] = sorted(tweets.values(), key=lambda t: t.id, reverse=True)
+      return self.timelines[screen_name]
+
+  def user_timeline(self, id, count=20, max_id=None, since_id=None):
+    tweets = [tweet for tweet in self.timeline(id)
+      if (max_id is None or tweet.id <= max_id) and (since_id is None or tweet.id > since_id)]
+    return tweets[:count]
+
+class RateLimiter(object):
+  '''
+  Allow at most calls requests in any period seconds, across threads
+  '''
+  def __init__(self, calls, period=900):
+    self.calls = calls
+    self.period = period
+    self.times = collections.deque()
+    self.lock = threading.Lock()
+
+  def wait(self):
+    with self.lock:
+      now = time.monotonic()
+      while self.times and self.times[0] <= now - self.period:
+        self.times.popleft()
+      if len(self.times) >= self.calls:
+        time.sleep(self.times.popleft() + self.period - now)
+      self.times.append(time.monotonic())
+
+class Checkpoints(object):
+  '''
+  Per-account progress, saved to a JSON file after every update
+  '''
+  def __init__(self, filename):
+    self.filename = filename
+    self.lock = threading.Lock()
+    self.accounts = dict()
+    if os.path.isfile(filename):
+      with open(filename) as f:
+        self.accounts = json.load(f)
+
+  def get(self, screen_name):
+    with self.lock:
+      return dict(self.accounts.get(screen_name, {}))
+
+  def update(self, screen_name, state):
+    with self.lock:
+      self.accounts[screen_name] = dict(state)
+      tmpfile = self.filename + '.tmp'
+      with open(tmpfile, 'w') as f:
+        json.dump(self.accounts, f, indent=2, sort_keys=True)
+      os.replace(tmpfile, self.filename)
+
+class TweetWriter(object):
+  '''
+  One buffered CSV writer shared by all threads
+  The header is written only when starting a new file
+  If the header has a key column (id_str), rows whose key is already
+  in the file are skipped, so pages fetched again after a crash
+  aren't written twice
+  '''
+  def __init__(self, filename, header, key='id_str'):
+    new = not os.path.isfile(filename) or not os.path.getsize(filename)
+    self.key = header.index(key) if key in header else None
+    self.seen = set() if new else self.read_keys(filename, key)
+    self.csvfile = open(filename, 'a', buffering=1 << 20)
+    self.writer = csv.writer(self.csvfile, quotechar='|', quoting=csv.QUOTE_ALL)
+    self.lock = threading.Lock()
+    if new:
+      self.writer.writerow(header)
+
+  def read_keys(self, filename, key):
+    ''' Values of the key column already written '''
+    keys = set()
+    if self.key is None:
+      return keys
+    with open(filename, newline='') as f:
+      reader = csv.reader(f, quotechar='|')
+      header = next(reader, [])
+      if key not in header:
+        return keys
+      column = header.index(key)
+      for row in reader:
+        if len(row) > column:
+          keys.add(row[column])
+    return keys
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def write(self, rows):
+    '''
+    Write rows and flush them, so a checkpoint saved afterwards
+    never gets ahead of the data on disk
+    '''
+    with self.lock:
+      if self.key is not None:
+        rows = [row for row in rows if str(row[self.key]) not in self.seen]
+        self.seen.update(str(row[self.key]) for row in rows)
+      self.writer.writerows(rows)
+      self.csvfile.flush()
+
+  def close(self):
+    self.csvfile.close()
+
+class Harvester(object):
+  '''
+  Fetch account timelines page by page, writing each page and
+  checkpointing the account before asking for the next one
+  '''
+  def __init__(self, api, columns, writer, checkpoints, limiter, num, record=None):
+    self.api = api
+    self.columns = columns
+    self.writer = writer
+    self.checkpoints = checkpoints
+    self.limiter = limiter
+    self.num = num
+    self.record = record
+
+  def fetch_page(self, screen_name, count=PAGE_SIZE, **kwargs):
+    self.limiter.wait()
+    page = self.api.user_timeline(id=screen_name, count=count, **kwargs)
+    if self.record:
+      with open(recording_filename(self.record, screen_name), 'a') as f:
+        for tweet in page:
+          f.write(json.dumps(tweet._json) + '\n')
+    return page
+
+  def write_page(self, screen_name, page):
+    rows = list()
+    for tweet in page:
+      row = [screen_name]
+      for column in self.columns:
+        row.append(getattr(tweet, column))
+      rows.append(row)
+    self.writer.write(rows)
+
+  def fetch_new(self, screen_name, state):
+    '''
+    Fetch tweets posted since the last run, walking back from the newest
+    since_id only moves once the walk is complete, so an interrupted run
+    never leaves a gap; the walk itself is checkpointed after each page
+    (newest tweet seen, max_id to continue from), so a rerun resumes it
+    rather than fetching those pages again
+    '''
+    walk = state.get('walk', {})
+    newest = walk.get('newest')
+    max_id = walk.get('max_id')
+    while True:
+      kwargs = {'since_id': state['since_id']}
+      if max_id is not None:
+        kwargs['max_id'] = max_id
+      page = self.fetch_page(screen_name, **kwargs)
+      if not page:
+        break
+      if newest is None:
+        newest = page[0].id
+      self.write_page(screen_name, page)
+      max_id = page[-1].id - 1
+      state['walk'] = {'newest': newest, 'max_id': max_id}
+      self.checkpoints.update(screen_name, state)
+    if newest is not None:
+      state['since_id'] = newest
+      state.pop('walk', None)
+      self.checkpoints.update(screen_name, state)
+
+  def backfill(self, screen_name, state):
+    '''
+    Fetch older tweets, continuing from max_id, until num are fetched
+    or the timeline runs out
+    '''
+    count = state.get('count', 0)
+    while not state.get('complete') and count < self.num:
+      kwargs = dict()
+      if 'max_id' in state:
+        kwargs['max_id'] = state['max_id']
+      page = self.fetch_page(screen_name, min(PAGE_SIZE, self.num - count), **kwargs)
+      if not page:
+        state['complete'] = True
+      else:
+        page = page[:self.num - count]
+        self.write_page(screen_name, page)
+        count += len(page)
+        state.setdefault('since_id', page[0].id)
+        state['max_id'] = page[-1].id - 1
+        state['count'] = count
+      self.checkpoints.update(screen_name, state)
+
+  def harvest(self, screen_name):
+    state = self.checkpoints.get(screen_name)
+    if 'since_id' in state:
+      self.fetch_new(screen_name, state)
+    self.backfill(screen_name, state)
+    return screen_name
 
 def main():
   options = get_options()
   config = read_config(options.config)
-  api = twitter_authenticate(config['Auth'])
+  if options.replay:
+    api = ReplayAPI(options.replay)
+  else:
+    api = twitter_authenticate(config['Auth'])
+  if options.record and not os.path.isdir(options.record):
+    os.makedirs(options.record)
   columns = config['App']['columns'].split(',')
-  write_tweets(options.output, [['name'] + columns]) # initialize output file
-  for screen_name in get_screen_names(options.screen_names):
-    if not len(screen_name):
-      continue
-    tweets = get_tweets(api, screen_name, options.num_tweets, columns)
-    write_tweets(options.output, tweets)
+  checkpoints = Checkpoints(options.checkpoint or options.output + '.checkpoint.json')
+  limiter = RateLimiter(options.rate)
+  screen_names = [name for name in get_screen_names(options.screen_names) if len(name)]
+  with TweetWriter(options.output, ['name'] + columns) as writer:
+    harvester = Harvester(api, columns, writer, checkpoints, limiter, options.num_tweets, options.record)
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+      futures = {executor.submit(harvester.harvest, name): name for name in screen_names}
+      for future in as_completed(futures):
+        try:
+          future.result()
+        except tweepy.TweepError as e:
+          print('Failed to fetch {}: {}'.format(futures[future], e), file=sys.stderr)
 
 if __name__ == '__main__':
   if sys.version_info[0] != 3:
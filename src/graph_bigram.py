@@ -5,80 +5,167 @@ Generate bigram networks with interlinks
 import os
 import sys
 import csv
+import shlex
 import igraph
+import hashlib
 import argparse
+from array import array
+
+
+def add_query_arguments(parser):
+    parser.add_argument('-o', dest='outputfile', help='Output filename')
+    parser.add_argument('-w', dest='words', action='append', help='Word(s) to base network on')
+    parser.add_argument('-d', dest='distance', type=int, default=1, help='Maximum distance from keyword(s) to include')
 
 
 def get_settings():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', dest='inputfile', required=True, help='CSV of bigram data')
-    parser.add_argument('-o', dest='outputfile', required=True, help='Output filename')
-    parser.add_argument('-w', dest='words', action='append', help='Word(s) to base network on')
-    parser.add_argument('-d', dest='distance', type=int, default=1, help='Maximum distance from keyword(s) to include')
+    add_query_arguments(parser)
     parser.add_argument('-f', dest='frequency', type=float, default=0, help='Minimum frequency to include')
     parser.add_argument('-m', dest='measure', type=float, default=0, help='Minimum measure')
-    return parser.parse_args()
-
-
-def build_network(data):
-    g = igraph.Graph().as_directed()
-    nodes = list()
+    parser.add_argument('-q', dest='queries', help='''File of queries to answer from one loaded graph, one per line,
+                        each with its own -w, -d and -o options; use - to read them interactively from stdin''')
+    parser.add_argument('--cache-dir', dest='cache_dir', help='Directory to keep the filtered graph in, keyed on input file and thresholds')
+    settings = parser.parse_args()
+    if settings.outputfile is None and settings.queries is None:
+        parser.error('one of -o or -q is required')
+    return settings
+
+
+def get_query_parser():
+    parser = argparse.ArgumentParser(prog='query', add_help=False)
+    add_query_arguments(parser)
+    return parser
+
+
+def load_network(filename, frequency, measure):
+    '''
+    Stream the bigram CSV, keeping only rows that meet the thresholds
+    Words are mapped to integer ids as they are first seen, and the
+    graph is built in one call from the surviving edges
+    '''
+    ids = dict()
     edges = list()
-    weights = list()
-    freq = list()
-    for row in data:
-        nodes.append(row['first'])
-        nodes.append(row['second'])
-        edge = (row['first'], row['second'])
-        edges.append(edge)
-        weights.append(float(row['measure']))
-        freq.append(float(row['freq']))
-
-    nodes = list(set(nodes))
-    g.add_vertices(nodes)
-    g.vs['label'] = nodes
-    g.add_edges(edges)
-    g.es['weight'] = weights
-    g.es['frequency'] = freq
+    weights = array('d')
+    freq = array('d')
+    with open(filename) as f:
+        for row in csv.DictReader(f):
+            row_freq = float(row['freq'])
+            row_weight = float(row['measure'])
+            if row_freq < frequency or row_weight < measure:
+                continue
+            first = ids.setdefault(row['first'], len(ids))
+            second = ids.setdefault(row['second'], len(ids))
+            edges.append((first, second))
+            weights.append(row_weight)
+            freq.append(row_freq)
+
+    nodes = list(ids)
+    return igraph.Graph(n=len(nodes), edges=edges, directed=True,
+                        vertex_attrs={'name': nodes, 'label': nodes},
+                        edge_attrs={'weight': list(weights),
+                                    'frequency': list(freq)})
+
+
+def cache_filename(cache_dir, filename, frequency, measure):
+    '''
+    Cache key: input path, size and modification time, and thresholds
+    '''
+    stat = os.stat(filename)
+    key = '|'.join(str(value) for value in [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, frequency, measure])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    basename = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, '{}-{}.pickle'.format(basename, digest))
+
+
+def load_cached_network(filename, frequency, measure, cache_dir):
+    '''
+    Load the filtered graph from cache_dir, building and saving it on a miss
+    '''
+    cached = cache_filename(cache_dir, filename, frequency, measure)
+    if os.path.isfile(cached):
+        return igraph.Graph.Read_Pickle(cached)
+    g = load_network(filename, frequency, measure)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    g.write_pickle(cached)
     return g
 
 
-def filter_network(g, words, frequency, measure, distance):
-    # Remove edges that don't match thresholds
-    edges = [e.index for e in g.es.select(frequency_lt=frequency)]
-    g.delete_edges(edges)
-    edges = [e.index for e in g.es.select(weight_lt=measure)]
-    g.delete_edges(edges)
+def ego_network(g, words, distance, index=None):
+    '''
+    Return the subgraph within distance of any of the given words
+    Pass an index of names to vertex ids to reuse it between queries
+    '''
+    if not words:
+        return g
+    if index is None:
+        index = dict(zip(g.vs['name'], range(g.vcount())))
+    sources = [index[word] for word in words if word in index]
+    neighborhoods = g.neighborhood(vertices=sources, mode='all', order=distance)
+    nids = set(n for neighborhood in neighborhoods for n in neighborhood)  # flatten the lists
+    return g.induced_subgraph(sorted(nids))
 
-    # Delete the orphaned nodes
-    nodes = [n.index for n in g.vs.select(_degree=0)]
-    g.delete_vertices(nodes)
 
-    # Find ego networks for selected words
-    sources = g.vs.select(name_in=words)
-    neighborhoods = g.neighborhood(vertices=sources, mode='all', order=distance)
-    nids = [n for neighborhood in neighborhoods for n in neighborhood]  # flatten the lists
-    nodes = g.vs.select(nids)
-    return g.subgraph(nodes)
+def write_network(g, outputfile):
+    outdir =  os.path.dirname(outputfile)
+    if outdir and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    g.write_gml(outputfile)
+
+
+def read_queries(filename):
+    '''
+    Yield queries from a file, or from stdin when filename is -
+    '''
+    if filename == '-':
+        if sys.stdin.isatty():
+            print('Enter queries like: -w word -d 2 -o out.gml (Ctrl-D to quit)')
+        for line in sys.stdin:
+            yield line
+    else:
+        with open(filename) as f:
+            for line in f:
+                yield line
+
+
+def answer_queries(g, queries):
+    '''
+    Write an ego network for every query against one loaded graph
+    Networks already computed for the same words and distance are reused
+    '''
+    parser = get_query_parser()
+    index = dict(zip(g.vs['name'], range(g.vcount())))
+    networks = dict()
+    for line in queries:
+        if not line.strip() or line.startswith('#'):
+            continue
+        try:
+            query = parser.parse_args(shlex.split(line))
+        except SystemExit:
+            continue  # argparse has already printed the problem
+        if query.outputfile is None:
+            print('Query needs an output file (-o): {}'.format(line.strip()))
+            continue
+        key = (tuple(sorted(query.words or [])), query.distance)
+        if key not in networks:
+            networks[key] = ego_network(g, words=query.words, distance=query.distance, index=index)
+        write_network(networks[key], query.outputfile)
+        print('{}: {} nodes, {} edges'.format(query.outputfile, networks[key].vcount(), networks[key].ecount()))
 
 
 def main():
     settings = get_settings()
-    with open(settings.inputfile) as f:
-        reader = csv.DictReader(f)
-        data = list(reader)
-
-    g = build_network(data)
-
-    ## Now filter the network
-    g = filter_network(g=g, frequency=settings.frequency, words=settings.words, distance=settings.distance, measure=settings.measure)
-
-
-    # Write results
-    outdir =  os.path.dirname(settings.outputfile)
-    if not os.path.isdir(outdir):
-        os.makedirs(outdir)
-    g.write_gml(settings.outputfile)
+    if settings.cache_dir:
+        g = load_cached_network(settings.inputfile, settings.frequency, settings.measure, settings.cache_dir)
+    else:
+        g = load_network(settings.inputfile, frequency=settings.frequency, measure=settings.measure)
+
+    if settings.outputfile is not None:
+        write_network(ego_network(g, words=settings.words, distance=settings.distance), settings.outputfile)
+    if settings.queries is not None:
+        answer_queries(g, read_queries(settings.queries))
 
 if __name__ == '__main__':
     if sys.version_info[0] != 3:
@@ -0,0 +1,220 @@
+'''
+Library for streaming network graphs to disk
+Nodes and edges are written as they arrive, exactly once, instead of
+building a networkx graph in memory first
+
+Formats are chosen by the output file extension:
+  .gexf     Gephi's GEXF
+  .graphml  GraphML
+  .edges    binary edge list of (source, target, weight) records as
+            little-endian uint32, uint32, float32, with node ids and
+            labels in a tab-separated .nodes file next to it
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+
+import os
+import struct
+import tempfile
+from xml.sax.saxutils import escape, quoteattr
+
+edge_record = struct.Struct('<IIf')
+
+
+class GraphWriter(object):
+    '''
+    Base class for streaming graph writers
+    Edges may be added before or after their nodes; they are spooled
+    to a temporary file and appended once all nodes are written
+    '''
+
+    def __init__(self, filename, directed=False):
+        self.filename = filename
+        self.directed = directed
+        self.nodes = dict()  # node id -> integer index
+        self.edges = 0
+        self.out = open(filename, 'w', encoding='utf-8', buffering=1 << 20)
+        self.spool = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_node(self, node, label=None, size=None):
+        ''' Write a node, unless it was already written '''
+        node = str(node)
+        if node in self.nodes:
+            return
+        self.nodes[node] = len(self.nodes)
+        self.write_node(node, node if label is None else str(label), size)
+
+    def add_edge(self, source, target, weight=None):
+        ''' Spool an edge, adding any node not yet written '''
+        self.add_node(source)
+        self.add_node(target)
+        self.spool.write(self.format_edge(self.edges, str(source),
+                                          str(target), weight))
+        self.edges += 1
+
+    def close(self):
+        self.write_middle()
+        self.spool.seek(0)
+        for line in self.spool:
+            self.out.write(line)
+        self.spool.close()
+        self.write_footer()
+        self.out.close()
+
+    def write_header(self):
+        pass
+
+    def write_node(self, node, label, size):
+        raise NotImplementedError
+
+    def format_edge(self, index, source, target, weight):
+        raise NotImplementedError
+
+    def write_middle(self):
+        pass
+
+    def write_footer(self):
+        pass
+
+
+class GexfWriter(GraphWriter):
+
+    def write_header(self):
+        self.out.write("<?xml version='1.0' encoding='utf-8'?>\n"
+                       '<gexf xmlns="http://www.gexf.net/1.2draft" '
+                       'xmlns:viz="http://www.gexf.net/1.2draft/viz" '
+                       'version="1.2">\n'
+                       '  <graph defaultedgetype="{}" mode="static">\n'
+                       '    <nodes>\n'.format(
+                           'directed' if self.directed else 'undirected'))
+
+    def write_node(self, node, label, size):
+        if size is None:
+            self.out.write('      <node id={} label={} />\n'.format(
+                quoteattr(node), quoteattr(label)))
+        else:
+            self.out.write('      <node id={} label={}>\n'
+                           '        <viz:size value={} />\n'
+                           '      </node>\n'.format(
+                               quoteattr(node), quoteattr(label),
+                               quoteattr(str(size))))
+
+    def format_edge(self, index, source, target, weight):
+        weight = '' if weight is None else ' weight="{}"'.format(float(weight))
+        return '      <edge id="{}" source={} target={}{} />\n'.format(
+            index, quoteattr(source), quoteattr(target), weight)
+
+    def write_middle(self):
+        self.out.write('    </nodes>\n    <edges>\n')
+
+    def write_footer(self):
+        self.out.write('    </edges>\n  </graph>\n</gexf>\n')
+
+
+class GraphMLWriter(GraphWriter):
+
+    def write_header(self):
+        self.out.write(
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="label" for="node" attr.name="label" '
+            'attr.type="string" />\n'
+            '  <key id="size" for="node" attr.name="size" '
+            'attr.type="double" />\n'
+            '  <key id="weight" for="edge" attr.name="weight" '
+            'attr.type="double" />\n'
+            '  <graph edgedefault="{}">\n'.format(
+                'directed' if self.directed else 'undirected'))
+
+    def write_node(self, node, label, size):
+        size = '' if size is None else \
+            '<data key="size">{}</data>'.format(float(size))
+        self.out.write('    <node id={}><data key="label">{}</data>{}'
+                       '</node>\n'.format(quoteattr(node), escape(label),
+                                          size))
+
+    def format_edge(self, index, source, target, weight):
+        weight = '' if weight is None else \
+            '<data key="weight">{}</data>'.format(float(weight))
+        return '    <edge source={} target={}>{}</edge>\n'.format(
+            quoteattr(source), quoteattr(target), weight)
+
+    def write_footer(self):
+        self.out.write('  </graph>\n</graphml>\n')
+
+
+class EdgeListWriter(GraphWriter):
+    '''
+    Compact binary edge list for graphs too big for XML
+    Edges go straight to disk; only the node index stays in memory
+    '''
+
+    def __init__(self, filename, directed=False):
+        self.filename = filename
+        self.directed = directed
+        self.nodes = dict()
+        self.edges = 0
+        self.out = open(os.path.splitext(filename)[0] + '.nodes', 'w',
+                        encoding='utf-8', buffering=1 << 20)
+        self.edge_file = open(filename, 'wb', buffering=1 << 20)
+
+    def write_node(self, node, label, size):
+        self.out.write('{}\t{}\t{}\n'.format(
+            node.replace('\t', ' '), label.replace('\t', ' '),
+            '' if size is None else size))
+
+    def add_edge(self, source, target, weight=None):
+        self.add_node(source)
+        self.add_node(target)
+        self.edge_file.write(edge_record.pack(
+            self.nodes[str(source)], self.nodes[str(target)],
+            1.0 if weight is None else float(weight)))
+        self.edges += 1
+
+    def close(self):
+        self.edge_file.close()
+        self.out.close()
+
+
+writers = {
+    '.gexf': GexfWriter,
+    '.graphml': GraphMLWriter,
+    '.edges': EdgeListWriter,
+}
+
+
+def open_graph(filename, directed=False):
+    '''
+    Return a graph writer for the format given by the file extension
+    '''
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in writers:
+        raise ValueError('Unknown graph format {}; use one of {}'.format(
+            ext, ', '.join(sorted(writers))))
+    return writers[ext](filename, directed)
+
+
+def read_edge_list(filename):
+    '''
+    Read a binary edge list back in
+    Return list of node ids and a generator of (source, target, weight)
+    '''
+    with open(os.path.splitext(filename)[0] + '.nodes',
+              encoding='utf-8') as f:
+        nodes = [line.split('\t', 1)[0] for line in f]
+
+    def edges():
+        with open(filename, 'rb') as f:
+            block = f.read(edge_record.size * 65536)
+            while block:
+                for source, target, weight in edge_record.iter_unpack(block):
+                    yield nodes[source], nodes[target], weight
+                block = f.read(edge_record.size * 65536)
+    return nodes, edges()
@@ -1,41 +1,53 @@
 '''
 Download metadata tables from inatheque.ina.fr
 
+Several result pages can be given with --url; they are fetched
+concurrently through scraper.Fetcher and cached, so re-running only
+downloads pages that changed.
+
 Mike Widner <mikewidner@stanford.edu>
 '''
 
 from bs4 import BeautifulSoup
-import requests
 import argparse
 import csv
 import re
+import scraper
 
 '''
 http://inatheque.ina.fr/Ina/ws/dlr/dlweb/general/ResultSet?rpp=-50&upp=0&w=NATIVE%28%27ITOUSTEXT+ph+like+%27%27Marine+Le+Pen%27%27+and+DATDIF+%3E+%27%2701%2F01%2F2014%27%27+and+GEN+ph+words+%27%27Marine+Le+Pen%27%27%27%29&r=1
 '''
 
-parser = argparse.ArgumentParser(description='Download metadata from Inatheque')
-group = parser.add_mutually_exclusive_group(required=True)
-group.add_argument('--url', help='URL to scrape')
-group.add_argument('-i', dest='input_file', help='Input file' )
-parser.add_argument('-o', dest='output_file', required=True,
-                   help='Output file')
-
-args = parser.parse_args()
-with open(args.output_file, 'w') as csvfile:
-  metadata = csv.writer(csvfile)
-  if (args.url):
-    req = requests.get(args.url)
-    text = req.text
-  else:
-    f = open(args.input_file, 'r', encoding='latin-1')
-    text = f.read()
-    f.close()
+def parse_arguments():
+  parser = argparse.ArgumentParser(description='Download metadata from Inatheque')
+  group = parser.add_mutually_exclusive_group(required=True)
+  group.add_argument('--url', action='append', help='URL to scrape; repeat for several result pages')
+  group.add_argument('-i', dest='input_file', help='Input file' )
+  parser.add_argument('-o', dest='output_file', required=True,
+                     help='Output file')
+  parser.add_argument('--cache-dir', dest='cache_dir', help='HTTP cache directory')
+  parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4, help='Number of pages to fetch at once')
+  parser.add_argument('--per-host', dest='per_host', type=int, default=2, help='Most requests in flight to one host')
+  return parser.parse_args()
+
+def read_pages(args):
+  '''
+  Return the text of each result page, fetched or read from file
+  '''
+  if args.url:
+    with scraper.Fetcher(args.cache_dir, jobs=args.jobs, per_host=args.per_host) as fetcher:
+      return [page.text for page in fetcher.fetch_all(args.url)]
+  with open(args.input_file, 'r', encoding='latin-1') as f:
+    return [f.read()]
+
+def parse_results(text):
+  '''
+  Return the column headers and rows of a result page
+  '''
   soup = BeautifulSoup(text, 'html.parser')
-  headers = soup.find_all(attrs={'class': 'header-select-title'})
-  metadata.writerow([column.string for column in headers])
-  rows = soup.find_all(attrs={'class': re.compile("result_line_?")})
-  for row in rows:
+  headers = [column.string for column in soup.find_all(attrs={'class': 'header-select-title'})]
+  rows = list()
+  for row in soup.find_all(attrs={'class': re.compile("result_line_?")}):
     output = list()
     for column in row.find_all('div'):
       # Indices have no id, we don't want them anyway
@@ -47,4 +59,17 @@ with open(args.output_file, 'w') as csvfile:
             output.append(column.a['href'])
           elif (column.strong is not None):
             output.append(column.strong.string.strip())
-    metadata.writerow(output)
+    rows.append(output)
+  return headers, rows
+
+def main():
+  args = parse_arguments()
+  results = [parse_results(text) for text in read_pages(args)]
+  with open(args.output_file, 'w') as csvfile:
+    metadata = csv.writer(csvfile)
+    metadata.writerow(results[0][0])
+    for headers, rows in results:
+      metadata.writerows(rows)
+
+if __name__ == '__main__':
+  main()
@@ -8,6 +8,7 @@ import argparse
 import metadata
 import unicodedata
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 
 def get_settings():
@@ -19,6 +20,8 @@ def get_settings():
                         required=True, help='Path to metadata files')
     parser.add_argument('-o', '--output', dest='output_path', required=True,
                         help='Output filename for joined metadata')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=8,
+                        help='Number of threads scanning directories')
     return parser.parse_args()
 
 
@@ -33,15 +36,62 @@ def normalize_filename(filename):
     return basename
 
 
-def get_text_filenames(path):
-    ''' Return list of all files in directory '''
+def scan_directory(path):
+    '''
+    List a single directory with one scandir call
+    Return its file paths and subdirectory paths
+    '''
+    files = list()
+    subdirs = list()
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry.path)
+    except OSError as err:
+        print('Cannot read {}: {}'.format(path, err))
+    return files, subdirs
+
+
+def scan_tree(path, jobs=8):
+    '''
+    Walk a directory tree, listing directories in parallel threads
+    Return list of all file paths
+    '''
     all_files = list()
-    for root, subdirs, files in os.walk(path):
-        for filename in files:
-            all_files.append(normalize_filename(filename))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {executor.submit(scan_directory, path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                all_files.extend(files)
+                pending.update(executor.submit(scan_directory, subdir)
+                               for subdir in subdirs)
     return all_files
 
 
+def build_file_index(path, jobs=8):
+    '''
+    Index every file under path by its NFC-normalised path
+    Mac OS X stores filenames decomposed; metadata is composed
+    Names that only differ in composition share a key, so each key
+    maps to a list of files
+    '''
+    index = defaultdict(list)
+    for filename in scan_tree(path, jobs):
+        index[unicodedata.normalize('NFC', filename)].append(filename)
+    return index
+
+
+def get_text_filenames(path, jobs=8):
+    ''' Return list of all files in directory '''
+    return [normalize_filename(os.path.basename(filename))
+            for filename in scan_tree(path, jobs)]
+
+
 def get_metadata_filenames(metadata):
     all_files = list()
     for row in metadata:
@@ -50,11 +100,18 @@ def get_metadata_filenames(metadata):
     return all_files
 
 
-def read_all_metadata(columns, path):
+def read_metadata_files(path):
+    '''
+    Read every metadata CSV under path exactly once
+    Return dict of rows keyed by CSV filename
+    '''
+    return {filename: metadata.read_csv(os.path.join(path, filename))
+            for filename in find_metadata_files(path)}
+
+
+def read_all_metadata(columns, tables):
     all_metadata = list()
-    files = find_metadata_files(path)
-    for filename in files:
-        m = metadata.read_csv(os.path.join(path, filename))
+    for filename, m in tables.items():
         for row in m:
             try:
                 all_metadata.append({col: row[col] for col in columns})
@@ -91,61 +148,76 @@ def fix_filenames(data, path):
         if (not len(ext) or ext == '.docx') and len(basename):
             ext = '.txt'
             filename = basename + ext
-        if not os.path.isfile(os.path.join(path, filename)):
-            print('File not found: "{}"'.format(filename))
         row['filename'] = os.path.join(path, filename)
         all_metadata.append(row)
     return all_metadata
 
 
+def check_corpus(data, index):
+    '''
+    Compare metadata rows against the file index in a single pass
+    Return sets of missing, extra and duplicate filenames; duplicates
+    are files listed more than once in the metadata, and files whose
+    names collide once normalised
+    '''
+    counts = defaultdict(int)
+    missing = set()
+    for row in data:
+        filename = unicodedata.normalize('NFC', row['filename'])
+        counts[filename] += 1
+        if filename not in index:
+            missing.add(row['filename'])
+    duplicates = set(filename for filename, count in counts.items()
+                     if count > 1)
+    for filenames in index.values():
+        if len(filenames) > 1:
+            duplicates.update(filenames)
+    return {
+        'missing': missing,
+        'extra': set(path for filename, filenames in index.items()
+                     if filename not in counts for path in filenames),
+        'duplicates': duplicates,
+    }
+
+
+def report(results):
+    ''' Print the results of check_corpus '''
+    for name in ['missing', 'extra', 'duplicates']:
+        print('-------- {} files {}'.format(len(results[name]), name))
+        for filename in sorted(results[name]):
+            print('"{}"'.format(filename))
+
+
 def find_metadata_files(path):
     ''' Looks specifically for CSV files '''
-    metadata_files = list()
-    for root, subdirs, files in os.walk(path):
-        for filename in files:
-            if filename.endswith('csv'):
-                metadata_files.append(filename)
-    return metadata_files
+    return [os.path.relpath(filename, path)
+            for filename in scan_tree(path) if filename.endswith('csv')]
 
 
-def get_common_columns(path):
-    headers = dict()
+def get_common_columns(tables):
     common = list()
     header_counts = defaultdict(int)
-    metadata_files = find_metadata_files(path)
-    for filename in metadata_files:
-        data = metadata.read_csv(os.path.join(path, filename))
-        headers[filename] = data[0]
-
-    for filename, columns in headers.items():
-        for col in columns:
+    tables = {filename: data for filename, data in tables.items() if len(data)}
+    for filename, data in tables.items():
+        for col in data[0]:
             # col = col.lower().strip()
             header_counts[col] += 1
 
     for name, count in header_counts.items():
-        if count == len(metadata_files):
+        if count == len(tables):
             common.append(name)
     return common
 
 
-def check_for_duplicates(data):
-    counts = defaultdict(int)
-    duplicates = list()
-    for row in data:
-        counts[row['filename']] += 1
-        if counts[row['filename']] > 1:
-            duplicates.append(row['filename'])
-    return set(duplicates)
-
-
 def main():
     settings = get_settings()
-    columns = get_common_columns(settings.metadata_path)
-    all_metadata = read_all_metadata(columns, settings.metadata_path)
+    tables = read_metadata_files(settings.metadata_path)
+    columns = get_common_columns(tables)
+    all_metadata = read_all_metadata(columns, tables)
     all_metadata = fix_filenames(all_metadata, settings.text_path)
     metadata.write_csv(settings.output_path, all_metadata)
-    dupes = check_for_duplicates(all_metadata)
-    print(dupes)
+    report(check_corpus(all_metadata,
+                        build_file_index(settings.text_path, settings.jobs)))
     # compare_file_lists(all_metadata, settings.metadata_path, settings.text_path)
 
 
@@ -1,11 +1,19 @@
 '''
 Create intersections of items in text files
+
+Every file's items go into one inverted index, item -> files, and all
+pairwise intersections are read off it in a single pass, so no set is
+built more than once and each pair is only intersected once.
+Optionally writes Jaccard and overlap coefficient matrices as CSV.
 '''
 
 import os
+import csv
 import sys
 import argparse
 import itertools
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 
 def get_settings():
@@ -14,6 +22,11 @@ def get_settings():
                         required=True, help='Input directory of text files')
     parser.add_argument('-o', '--output', dest='output', required=True,
                         help='Output directory for results')
+    parser.add_argument('-m', '--matrix', dest='matrices', action='append',
+                        choices=sorted(measures), default=[],
+                        help='Also write a matrix of this similarity measure')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=8,
+                        help='Number of output files to write at once')
     return parser.parse_args()
 
 
@@ -38,19 +51,102 @@ def make_filename(pair):
     return filename
 
 
+def jaccard(shared, size1, size2):
+    union = size1 + size2 - shared
+    return shared / union if union else 0.0
+
+
+def overlap(shared, size1, size2):
+    smallest = min(size1, size2)
+    return shared / smallest if smallest else 0.0
+
+
+measures = {
+    'jaccard': jaccard,
+    'overlap': overlap,
+}
+
+
+def build_index(texts, names):
+    '''
+    Map each item to the indices of the files it appears in
+    '''
+    index = collections.defaultdict(list)
+    for i, name in enumerate(names):
+        for item in set(texts[name]):
+            index[item].append(i)
+    return index
+
+
+def get_intersections(index):
+    '''
+    Return a dict of (i, j) -> items shared by files i and j, i < j
+    Work is proportional to the size of the intersections themselves
+    '''
+    intersections = collections.defaultdict(list)
+    for item, files in index.items():
+        for pair in itertools.combinations(files, 2):
+            intersections[pair].append(item)
+    return intersections
+
+
+def write_items(filename, items):
+    with open(filename, 'w') as f:
+        for row in items:
+            f.write(row)
+            f.write("\n")
+
+
+def write_intersections(names, intersections, output, jobs):
+    '''
+    Write the intersection of every ordered pair of files, concurrently
+    '''
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = list()
+        for pair in itertools.permutations(range(len(names)), 2):
+            items = intersections.get(tuple(sorted(pair)), [])
+            filename = make_filename((names[pair[0]], names[pair[1]]))
+            futures.append(executor.submit(
+                write_items, os.path.join(output, filename), items))
+        for future in futures:
+            future.result()
+
+
+def write_matrix(filename, names, sizes, intersections, measure):
+    '''
+    Write a square matrix of a similarity measure between all files
+    '''
+    labels = [get_filename(name) for name in names]
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow([''] + labels)
+        for i in range(len(names)):
+            row = list()
+            for j in range(len(names)):
+                if i == j:
+                    shared = sizes[i]
+                else:
+                    shared = len(intersections.get((min(i, j), max(i, j)), []))
+                row.append(measure(shared, sizes[i], sizes[j]))
+            writer.writerow([labels[i]] + row)
+
+
 def main():
     settings = get_settings()
     if not os.path.isdir(settings.output):
         os.makedirs(settings.output)
     texts = get_texts(settings.input)
-    for pair in itertools.permutations(list(texts.keys()), 2):
-        intersection = set(texts[pair[0]]) & set(texts[pair[1]])
-        filename = make_filename(pair)
-        f = open(os.path.join(settings.output, filename), 'w')
-        for row in intersection:
-            f.write(row)
-            f.write("\n")
-        f.close()
+    names = list(texts.keys())
+    index = build_index(texts, names)
+    intersections = get_intersections(index)
+    write_intersections(names, intersections, settings.output, settings.jobs)
+    sizes = [0] * len(names)
+    for files in index.values():
+        for i in files:
+            sizes[i] += 1
+    for matrix in settings.matrices:
+        write_matrix(os.path.join(settings.output, matrix + '.csv'), names,
+                     sizes, intersections, measures[matrix])
 
 
 if __name__ == '__main__':
@@ -1,7 +1,9 @@
 '''
 Takes topic model output and converts it into a Gexf file, which Gephi can read
+(or GraphML or a binary edge list, by output extension; see graph_writer.py)
 Assumes that your topic model input was a corpus where each document was split into chunks
-and that each chunk lives in a subdirectory for the parent document
+and that each chunk lives in a subdirectory for the parent document,
+or was exported by chunks2mallet.py with a <document>/<chunk> name
 Expects the standard Mallet output of doc-topics.txt and topic-keys.txt
 
 Mike Widner <mikewidner@stanford.edu>
@@ -13,8 +15,9 @@ import os
 import csv
 import sys
 import numpy
-import networkx as nx
+import graph_writer
 from optparse import OptionParser
+from urllib.parse import unquote
 
 def parse_options():
     parser = OptionParser(usage='Usage: %prog -d doc-topics.txt -t topic-keys.txt -o output')
@@ -35,6 +38,12 @@ def parse_options():
                       default = 'median',
                       help = "The method by which to calculate document-topic edge weights: "
                               "median, mean, or max [default: %default]")
+    parser.add_option('-f', '--format',
+                      dest = 'doc_format',
+                      default = 'auto',
+                      choices = ['auto', 'sparse', 'dense'],
+                      help = "Layout of doc-topics.txt: sparse (topic/proportion pairs), "
+                              "dense (one column per topic), or auto [default: %default]")
 
     options, args = parser.parse_args()
     if options.doc_topics is None or options.topics is None or options.out is None:
@@ -47,81 +56,111 @@ def split_doc_chunk(doc):
   Return the document name and the chunk name
   '''
   doc = doc.replace('file:', '', 1) # strip any leading "file:" string
-  doc, chunk = os.path.split(doc)
+  doc, chunk = os.path.split(unquote(doc)) # chunks2mallet.py quotes names
   # tweaks for LePen - take last 3 segments of path for name
   doc = doc.rsplit('/', 3)       # Note: assumes *nix-style path delimiters
   label = "-".join(doc[1:])
   filename = doc[-1]
   return(filename, chunk, label)
 
-def build_edge_weight_lists(weights):
+def is_sparse(fields):
   '''
-  Build a list of all edge weights by document and topic
-  Return aggregate weights and document labels
+  Sparse rows alternate topic ids and proportions; dense rows are all proportions
   '''
-  all_weights = dict()
-  labels = dict()
-  for weight in weights:
-    doc_name, chunk_name, label = split_doc_chunk(weight[1])
-    labels[doc_name] = label
-    weight = weight[2:] # first two items are index and file path
-    while len(weight) >= 2:
-      tid = weight.pop(0)
-      current_weight = float(weight.pop(0))
-      if doc_name not in all_weights.keys():
-        all_weights[doc_name] = dict()
-      if tid not in all_weights[doc_name].keys():
-        all_weights[doc_name][tid] = list()
-      all_weights[doc_name][tid].append(current_weight)
-  return(all_weights, labels)
+  values = fields[2:]
+  return len(values) % 2 == 0 and all(tid.isdigit() for tid in values[::2])
 
-def calc_edge_weights(all_weights, weight_method):
+def load_doc_topics(lines, num_topics=None, doc_format='auto'):
   '''
-  Determine the edge weights for each document-topic link
+  Parse MALLET doc-topics output, sparse or dense, in one pass
+  Return the chunk names and a chunk x topic matrix of proportions
+  '''
+  names = list()
+  rows = list()
+  for line in lines:
+    if line.startswith('#') or not line.strip():
+      continue # header
+    fields = line.rstrip('\r\n').rstrip('\t').split('\t')
+    if doc_format == 'auto':
+      doc_format = 'sparse' if is_sparse(fields) else 'dense'
+    names.append(fields[1])
+    if doc_format == 'sparse':
+      rows.append((numpy.array(fields[2::2], dtype=int),
+                   numpy.array(fields[3::2], dtype=float)))
+    else:
+      rows.append(numpy.array(fields[2:], dtype=float))
+
+  if doc_format == 'sparse':
+    num_topics = max([num_topics or 0] +
+                     [tids.max() + 1 for tids, weights in rows if len(tids)])
+    matrix = numpy.zeros((len(rows), num_topics))
+    for i, (tids, weights) in enumerate(rows):
+      matrix[i, tids] = weights
+  elif len(rows):
+    matrix = numpy.vstack(rows)
+  else:
+    matrix = numpy.zeros((0, num_topics or 0))
+  return names, matrix
+
+def group_chunks(names):
+  '''
+  Map every chunk to its parent document
+  Return document names, their labels, and each chunk's document index
+  '''
+  docs = dict()
+  labels = list()
+  doc_index = numpy.empty(len(names), dtype=int)
+  for i, name in enumerate(names):
+    doc_name, chunk_name, label = split_doc_chunk(name)
+    if doc_name not in docs:
+      docs[doc_name] = len(docs)
+      labels.append(label)
+    doc_index[i] = docs[doc_name]
+  return list(docs), labels, doc_index
+
+def calc_edge_weights(matrix, doc_index, weight_method):
+  '''
+  Reduce chunk rows to one row per document
   Method varies based on option chosen
   '''
-  doc_topic_weights = dict()
-  for doc_name in all_weights.keys():
-    if doc_name not in doc_topic_weights.keys():
-      doc_topic_weights[doc_name] = dict()
-    for tid in all_weights[doc_name].keys():
-      if weight_method == 'max':
-        doc_topic_weights[doc_name][tid] = max(all_weights[doc_name][tid])
-      elif weight_method == 'median':
-        doc_topic_weights[doc_name][tid] = numpy.median(all_weights[doc_name][tid])
-      elif weight_method == 'mean':
-        doc_topic_weights[doc_name][tid] = numpy.mean(all_weights[doc_name][tid])
- 
-  return(doc_topic_weights)
+  order = numpy.argsort(doc_index, kind='mergesort')
+  matrix = matrix[order]
+  counts = numpy.bincount(doc_index)
+  starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+  if weight_method == 'max':
+    return numpy.maximum.reduceat(matrix, starts, axis=0)
+  elif weight_method == 'mean':
+    return numpy.add.reduceat(matrix, starts, axis=0) / counts[:, numpy.newaxis]
+  elif weight_method == 'median':
+    return numpy.vstack([numpy.median(matrix[start:start + count], axis=0)
+                         for start, count in zip(starts, counts)])
+  raise ValueError('Unknown weight method: {}'.format(weight_method))
 
-def write_graph_file(topics, doc_topic_weights, labels, outfile):
+def write_graph_file(topics, docs, labels, doc_topic_weights, outfile):
   ''' 
-  Generate the network graph and write it 
+  Stream the network graph to outfile
   '''
-  G = nx.Graph()
-  for doc in doc_topic_weights.keys():
-    G.add_node(doc, label=labels[doc])
-  # G.add_nodes_from([doc for doc in doc_topic_weights.keys()])
-  for topic in topics:
-    G.add_node(topic[0], label=topic[2], viz={'size': topic[1]}) # size by topic weight
-    for doc in doc_topic_weights.keys():
-      for tid in doc_topic_weights[doc].keys():
-        if tid == topic[0]:
-          G.add_edge(tid, doc, weight=doc_topic_weights[doc][tid])
-
   try:
-    nx.write_gexf(G, outfile)
+    with graph_writer.open_graph(outfile) as graph:
+      for doc, label in zip(docs, labels):
+        graph.add_node(doc, label=label)
+      for topic in topics:
+        graph.add_node(topic[0], label=topic[2], size=topic[1]) # size by topic weight
+      doc_ids, tids = numpy.nonzero(doc_topic_weights > 0)
+      for doc, tid in zip(doc_ids, tids):
+        graph.add_edge(tid, docs[doc], doc_topic_weights[doc, tid])
   except Exception as err:
     print("Could not write graphfile", outfile, err)
 
 def main():
   options = parse_options()
-  weights = csv.reader(open(options.doc_topics, 'r'), delimiter='\t')
-  next(weights, None) # skip first line, which is a poorly-formatted header
-  all_weights, labels = build_edge_weight_lists(weights)
-  doc_topic_weights = calc_edge_weights(all_weights, options.weight_method)  
-  topics = csv.reader(open(options.topics, 'r'), delimiter='\t')
-  write_graph_file(topics, doc_topic_weights, labels, options.out)
+  with open(options.topics, 'r') as f:
+    topics = list(csv.reader(f, delimiter='\t'))
+  with open(options.doc_topics, 'r') as f:
+    names, matrix = load_doc_topics(f, len(topics), options.doc_format)
+  docs, labels, doc_index = group_chunks(names)
+  doc_topic_weights = calc_edge_weights(matrix, doc_index, options.weight_method)
+  write_graph_file(topics, docs, labels, doc_topic_weights, options.out)
 
 if __name__ == '__main__':
   # nothing specific to Python 3 in here
@@ -0,0 +1,294 @@
+'''
+Approximate vocabulary similarity between texts with MinHash sketches
+
+Each text is reduced to a signature: the minimum of many independent
+hashes over its set of words (or word shingles). The fraction of
+positions where two signatures agree estimates the Jaccard similarity
+of the two sets, with a standard error of about 1 / sqrt(permutations).
+
+Signatures are computed in parallel and stored in an .npz file, so
+later runs only sketch texts they haven't seen or that changed since.
+From them we write either the full pairwise similarity matrix, or each
+text's top-k neighbours found through locality-sensitive hashing:
+signatures are cut into bands, and only texts sharing a band are
+compared, which avoids looking at every pair.
+
+Every file under a directory is read, hidden ones aside, unless -x
+names the extension texts have.
+
+Usage:
+  python minhash.py -i corpus/ -s signatures.npz --top-k 10 -o neighbours.csv
+  python minhash.py -i corpus/ -s signatures.npz --matrix similarity.csv
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+
+import os
+import re
+import csv
+import sys
+import hashlib
+import argparse
+import collections
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+word_pattern = re.compile(r'\w+')
+CHUNK = 4096  # hashes per block when taking minimums, to bound memory
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description='Compare text vocabularies with MinHash sketches')
+    parser.add_argument('-i', dest='input', action='append', required=True,
+                        help='Text file, or directory of texts; repeatable')
+    parser.add_argument('-x', '--extension', dest='extension',
+                        help='Only take files with this extension (e.g. .txt) '
+                        'from directories; by default every file but hidden ones')
+    parser.add_argument('-s', '--signatures', dest='signatures',
+                        help='Signature store (.npz); loaded if it exists, '
+                        'updated with any new texts')
+    parser.add_argument('-n', '--permutations', dest='permutations', type=int,
+                        default=128, help='Hashes per signature; more is '
+                        'more accurate (error about 1/sqrt(n))')
+    parser.add_argument('-k', '--shingle', dest='shingle', type=int, default=1,
+                        help='Words per shingle; 1 compares vocabularies')
+    parser.add_argument('--seed', dest='seed', type=int, default=1,
+                        help='Seed for the hash functions')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='Number of processes for sketching')
+    parser.add_argument('--matrix', dest='matrix',
+                        help='Write the full pairwise similarity matrix to this CSV')
+    parser.add_argument('--top-k', dest='top_k', type=int,
+                        help='Write the k most similar texts to each text')
+    parser.add_argument('-t', '--threshold', dest='threshold', type=float,
+                        default=0.5, help='Similarity LSH is tuned to find; '
+                        'lower finds more neighbours but compares more pairs')
+    parser.add_argument('-o', '--output', dest='output',
+                        help='Output CSV for --top-k')
+    options = parser.parse_args()
+    if options.top_k and not options.output:
+        parser.error('--top-k requires -o')
+    return options
+
+
+def find_texts(paths, extension=None):
+    '''
+    Expand directories into the files under them, skipping hidden files
+    and, if extension is given, files without it
+    '''
+    filenames = list()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                filenames.extend(os.path.join(root, f) for f in sorted(files)
+                                 if not f.startswith('.') and
+                                 (extension is None or f.endswith(extension)))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def hash_functions(permutations, seed):
+    '''
+    Multiply-shift hashes h(x) = (a * x + b) mod 2^64 >> 32, a odd
+    Return arrays a and b, one entry per permutation
+    '''
+    rs = np.random.RandomState(seed)
+    a = np.frombuffer(rs.bytes(8 * permutations), dtype=np.uint64) | np.uint64(1)
+    b = np.frombuffer(rs.bytes(8 * permutations), dtype=np.uint64)
+    return a, b
+
+
+def shingles(text, size):
+    ''' Set of lowercased words, or of runs of size words '''
+    words = word_pattern.findall(text.lower())
+    if size == 1:
+        return set(words)
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def token_hashes(tokens):
+    ''' 32-bit hash of each token, stable across runs and processes '''
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(t.encode('utf-8'),
+                                        digest_size=4).digest(), 'little')
+         for t in tokens), dtype=np.uint64, count=len(tokens))
+
+
+def signature(filename, a, b, size):
+    '''
+    MinHash signature of a text; all ones (the maximum) if it is empty
+    '''
+    with open(filename, encoding='utf-8', errors='replace') as f:
+        values = token_hashes(shingles(f.read(), size))
+    sig = np.full(len(a), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(values), CHUNK):
+        block = values[start:start + CHUNK, None]
+        hashed = ((block * a + b) >> np.uint64(32)).astype(np.uint32)
+        np.minimum(sig, hashed.min(axis=0), out=sig)
+    return sig
+
+
+def sketch(filenames, options, jobs=None):
+    ''' Signatures of many texts, computed in parallel '''
+    a, b = hash_functions(options.permutations, options.seed)
+    if not filenames:
+        return np.empty((0, options.permutations), dtype=np.uint32)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        sigs = list(executor.map(signature, filenames, [a] * len(filenames),
+                                 [b] * len(filenames),
+                                 [options.shingle] * len(filenames),
+                                 chunksize=16))
+    return np.vstack(sigs)
+
+
+def file_stamps(filenames):
+    ''' Size and modification time of each file, (-1, -1) if missing '''
+    stamps = list()
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+            stamps.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamps.append((-1, -1))
+    return np.array(stamps, dtype=np.int64).reshape(-1, 2)
+
+
+def save_signatures(filename, names, signatures, stamps, options):
+    with open(filename, 'wb') as f:
+        np.savez_compressed(f, names=np.array(names, dtype=str),
+                            signatures=signatures, stamps=stamps,
+                            params=np.array([options.permutations,
+                                             options.shingle, options.seed]))
+
+
+def load_signatures(filename, options):
+    '''
+    Return names, signatures and file stamps from a store, or empty ones
+    if it is missing or was made with different settings
+    '''
+    if filename and os.path.isfile(filename):
+        store = np.load(filename)
+        params = [options.permutations, options.shingle, options.seed]
+        if store['params'].tolist() == params and 'stamps' in store.files:
+            return store['names'].tolist(), store['signatures'], store['stamps']
+        print('Settings differ from {}; sketching again'.format(filename))
+    return ([], np.empty((0, options.permutations), dtype=np.uint32),
+            np.empty((0, 2), dtype=np.int64))
+
+
+def get_signatures(filenames, options):
+    '''
+    Signatures for filenames, sketching only those not in the store or
+    whose size or modification time changed since they were stored
+    '''
+    names, signatures, stamps = load_signatures(options.signatures, options)
+    known = dict(zip(names, range(len(names))))
+    current = file_stamps(filenames)
+    new = list(collections.OrderedDict.fromkeys(
+        f for f, stamp in zip(filenames, current)
+        if f not in known or (stamps[known[f]] != stamp).any()))
+    if new:
+        changed = set(new)
+        keep = [i for i, name in enumerate(names) if name not in changed]
+        names = [names[i] for i in keep] + new
+        signatures = np.vstack([signatures[keep], sketch(new, options, options.jobs)])
+        stamps = np.concatenate([stamps[keep], file_stamps(new)])
+        if options.signatures:
+            save_signatures(options.signatures, names, signatures, stamps, options)
+        known = dict(zip(names, range(len(names))))
+    return signatures[[known[f] for f in filenames]]
+
+
+def similarity(signatures, i, others=None):
+    ''' Estimated Jaccard similarity of text i with others (or all) '''
+    others = signatures if others is None else signatures[others]
+    return (others == signatures[i]).mean(axis=1)
+
+
+def write_matrix(filename, names, signatures):
+    '''
+    Write every pairwise similarity; this is quadratic by nature
+    '''
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow([''] + names)
+        for i, name in enumerate(names):
+            writer.writerow([name] + ['{:.4f}'.format(s)
+                                      for s in similarity(signatures, i)])
+
+
+def choose_bands(permutations, threshold):
+    '''
+    Pick bands * rows = permutations so that texts at the threshold
+    share a band about half the time: (1 / bands) ** (1 / rows) ~ threshold
+    '''
+    options = [(b, permutations // b) for b in range(1, permutations + 1)
+               if permutations % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) -
+                                           threshold))
+
+
+def candidates(signatures, bands, rows):
+    '''
+    Map each text to the texts sharing at least one band with it
+    '''
+    neighbours = collections.defaultdict(set)
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        order = np.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+        for start, end in zip(starts[:-1], starts[1:]):
+            if end - start > 1:
+                bucket = order[start:end].tolist()
+                for i in bucket:
+                    neighbours[i].update(bucket)
+    return neighbours
+
+
+def top_neighbours(signatures, k, threshold):
+    '''
+    Yield (i, j, similarity) for the k most similar texts to each text,
+    comparing only LSH candidates
+    '''
+    bands, rows = choose_bands(signatures.shape[1], threshold)
+    neighbours = candidates(signatures, bands, rows)
+    for i in range(len(signatures)):
+        others = np.array(sorted(neighbours.get(i, set()) - {i}), dtype=np.int64)
+        if not len(others):
+            continue
+        scores = similarity(signatures, i, others)
+        best = np.argsort(-scores, kind='mergesort')[:k]
+        for j in best:
+            yield i, int(others[j]), float(scores[j])
+
+
+def write_neighbours(filename, names, neighbours):
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['text', 'neighbour', 'similarity'])
+        for i, j, score in neighbours:
+            writer.writerow([names[i], names[j], '{:.4f}'.format(score)])
+
+
+def main():
+    options = get_options()
+    filenames = find_texts(options.input, options.extension)
+    signatures = get_signatures(filenames, options)
+    if options.matrix:
+        write_matrix(options.matrix, filenames, signatures)
+    if options.top_k:
+        write_neighbours(options.output, filenames,
+                         top_neighbours(signatures, options.top_k,
+                                        options.threshold))
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] != 3:
+        print("This program requires Python 3.")
+        exit(-1)
+    main()
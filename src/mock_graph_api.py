@@ -0,0 +1,102 @@
+'''
+Local mock of the parts of the Facebook Graph API facebook_extract uses
+
+Serves generated feeds, post details and linked pages, with optional
+latency per request, so the crawler can be run and benchmarked offline:
+
+  python mock_graph_api.py -p 8000 --feeds 3 --posts 500 --latency 50
+  python facebook_extract.py -i id -s secret -o /tmp/fb \
+    --graph-url http://localhost:8000/ -f feed0 -f feed1 -f feed2
+
+Linked pages are shared between feeds, so link deduplication can be
+checked as well; tests/test_facebook_extract.py does both end to end.
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+
+import sys
+import json
+import time
+import argparse
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+settings = None
+statuses = ['shared_story', 'mobile_status_update', 'created_note', 'added_photos']
+
+def get_settings():
+  parser = argparse.ArgumentParser(description='Serve a mock Graph API')
+  parser.add_argument('-p', '--port', dest='port', type=int, default=8000, help='Port to listen on')
+  parser.add_argument('--feeds', dest='feeds', type=int, default=3, help='Number of feeds, named feed0, feed1, ...')
+  parser.add_argument('--posts', dest='posts', type=int, default=500, help='Posts per feed')
+  parser.add_argument('--page-size', dest='page_size', type=int, default=25, help='Posts per feed page')
+  parser.add_argument('--links', dest='links', type=int, default=200, help='Number of distinct linked pages')
+  parser.add_argument('--latency', dest='latency', type=float, default=0, help='Milliseconds to wait before each response')
+  return parser.parse_args()
+
+def make_post(feed, n):
+  return {
+    'id': '{}_{}'.format(feed, n),
+    'status_type': statuses[n % len(statuses)],
+    'created_time': '2015-12-{:02d}T12:00:00+0000'.format(1 + n % 28),
+    'message': 'Post {} from {}'.format(n, feed),
+    'link': 'http://localhost:{}/links/{}'.format(settings.port, n % settings.links),
+  }
+
+class GraphHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'  # keep connections open for pooling clients
+
+  def send(self, body, content_type='application/json; charset=UTF-8'):
+    body = body.encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if settings.latency:
+      time.sleep(settings.latency / 1000)
+    url = urlparse(self.path)
+    query = parse_qs(url.query)
+    parts = url.path.strip('/').split('/')
+    if parts == ['oauth', 'access_token']:
+      self.send(json.dumps({'access_token': 'mock-token', 'token_type': 'bearer'}))
+    elif parts[0] == 'links' and len(parts) == 2:
+      self.send('<html><body><p>Linked page {}</p></body></html>'.format(parts[1]), 'text/html; charset=UTF-8')
+    elif len(parts) == 2 and parts[1] == 'feed':
+      self.send(json.dumps(self.feed_page(parts[0], int(query.get('after', ['0'])[0]))))
+    elif len(parts) == 1 and '_' in parts[0]:
+      feed, n = parts[0].rsplit('_', 1)
+      self.send(json.dumps(make_post(feed, int(n))))
+    else:
+      self.send_error(404)
+
+  def feed_page(self, feed, start):
+    end = min(start + settings.page_size, settings.posts)
+    page = {'data': [make_post(feed, n) for n in range(start, end)]}
+    if end < settings.posts:
+      page['paging'] = {'next': 'http://localhost:{}/{}/feed?after={}'.format(settings.port, feed, end)}
+    return page
+
+  def log_message(self, format, *args):
+    pass
+
+class MockServer(ThreadingHTTPServer):
+  request_queue_size = 128
+
+def main():
+  global settings
+  settings = get_settings()
+  server = MockServer(('localhost', settings.port), GraphHandler)
+  print('Mock Graph API on http://localhost:{}/'.format(settings.port))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    server.server_close()
+
+if __name__ == "__main__":
+  if sys.version_info[0] != 3:
+    print("This program requires Python 3.")
+    exit(-1)
+  main()
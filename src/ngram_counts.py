@@ -0,0 +1,318 @@
+'''
+Corpus-wide n-gram counting with integer-encoded tokens
+
+Words are mapped to integer ids and every n-gram is packed into a single
+int64 key, so a count table is a pair of sorted numpy arrays rather than
+a dict of tuples. Tables from many files merge into one corpus table,
+and association measures are computed over whole arrays at once from
+the same counts nltk's collocation finders would use.
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+
+import numpy
+
+ID_BITS = 21  # bits per word id in a packed key; three ids fit in int64
+MAX_VOCABULARY = 1 << ID_BITS
+ID_MASK = MAX_VOCABULARY - 1
+SMALL = 1e-20  # same smoothing constant as nltk.metrics.association
+
+
+class Vocabulary(object):
+    '''
+    Map words to consecutive integer ids
+    '''
+
+    def __init__(self):
+        self.ids = dict()
+        self.words = list()
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word):
+        if word not in self.ids:
+            if len(self.words) >= MAX_VOCABULARY:
+                raise ValueError('Vocabulary exceeds {} words'.format(
+                    MAX_VOCABULARY))
+            self.ids[word] = len(self.words)
+            self.words.append(word)
+        return self.ids[word]
+
+    def encode(self, words):
+        ''' Return an array of ids for a list of words '''
+        return numpy.fromiter((self.add(word) for word in words),
+                              dtype=numpy.int64, count=len(words))
+
+    def decode(self, ids):
+        return [self.words[i] for i in ids]
+
+    def ranks(self, ids=None):
+        '''
+        Position of each word id in alphabetical order, among ids if given
+        Used to break ties between equal scores the way nltk does
+        '''
+        ids = numpy.arange(len(self.words)) if ids is None else numpy.unique(ids)
+        order = sorted(ids, key=self.words.__getitem__)
+        ranks = numpy.zeros(len(self.words), dtype=numpy.int64)
+        ranks[order] = numpy.arange(len(order))
+        return ranks
+
+
+def pack(ids, n, gap=False):
+    '''
+    Pack every run of n consecutive ids into one key
+    With gap, pack (first, third) of each run of three instead
+    '''
+    if gap:
+        return (ids[:-2] << ID_BITS) | ids[2:] if len(ids) > 2 \
+            else numpy.empty(0, dtype=numpy.int64)
+    if len(ids) < n:
+        return numpy.empty(0, dtype=numpy.int64)
+    keys = ids[:len(ids) - n + 1].copy()
+    for i in range(1, n):
+        keys = (keys << ID_BITS) | ids[i:len(ids) - n + 1 + i]
+    return keys
+
+
+def unpack(keys, n):
+    ''' Return one array of word ids per position in the n-grams '''
+    return [(keys >> (ID_BITS * (n - 1 - i))) & ID_MASK for i in range(n)]
+
+
+class CountTable(object):
+    '''
+    Sorted unique keys with their counts
+    '''
+
+    def __init__(self, keys=None, counts=None):
+        self.keys = numpy.empty(0, dtype=numpy.int64) if keys is None else keys
+        self.counts = numpy.empty(0, dtype=numpy.int64) if counts is None \
+            else counts
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_keys(cls, keys):
+        keys, counts = numpy.unique(keys, return_counts=True)
+        return cls(keys, counts.astype(numpy.int64))
+
+    @classmethod
+    def merge(cls, tables):
+        ''' Sum several tables into one '''
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls()
+        if len(tables) == 1:
+            return tables[0]
+        keys = numpy.concatenate([table.keys for table in tables])
+        counts = numpy.concatenate([table.counts for table in tables])
+        order = numpy.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+        return cls(keys[starts], numpy.add.reduceat(counts[order], starts))
+
+    def lookup(self, keys):
+        ''' Return the count of each key, 0 for keys not in the table '''
+        if not len(self.keys):
+            return numpy.zeros(len(keys), dtype=numpy.int64)
+        index = numpy.searchsorted(self.keys, keys)
+        index[index == len(self.keys)] = 0
+        return numpy.where(self.keys[index] == keys, self.counts[index], 0)
+
+    def remap(self, mapping, n):
+        '''
+        Return a table with every word id translated through mapping,
+        e.g. from one file's vocabulary to the corpus vocabulary
+        '''
+        words = [mapping[w] for w in unpack(self.keys, n)]
+        keys = words[0]
+        for w in words[1:]:
+            keys = (keys << ID_BITS) | w
+        order = numpy.argsort(keys)
+        return CountTable(keys[order], self.counts[order])
+
+    def filter(self, min_freq):
+        ''' Return a table without keys counted fewer than min_freq times '''
+        keep = self.counts >= min_freq
+        return CountTable(self.keys[keep], self.counts[keep])
+
+
+class NgramCounts(object):
+    '''
+    Unigram, bigram and trigram counts for a file or a whole corpus
+    Bigrams are adjacent pairs; gaps are (first, third) word pairs of
+    every trigram, which likelihood ratio needs for trigrams
+    '''
+
+    def __init__(self, unigrams, bigrams, trigrams, gaps, total):
+        self.unigrams = unigrams
+        self.bigrams = bigrams
+        self.trigrams = trigrams
+        self.gaps = gaps
+        self.total = total
+
+    @classmethod
+    def from_ids(cls, ids):
+        return cls(CountTable.from_keys(ids),
+                   CountTable.from_keys(pack(ids, 2)),
+                   CountTable.from_keys(pack(ids, 3)),
+                   CountTable.from_keys(pack(ids, 3, gap=True)),
+                   len(ids))
+
+    @classmethod
+    def merge(cls, counts):
+        ''' Sum the counts of several files; n-grams never span files '''
+        counts = list(counts)
+        return cls(CountTable.merge([c.unigrams for c in counts]),
+                   CountTable.merge([c.bigrams for c in counts]),
+                   CountTable.merge([c.trigrams for c in counts]),
+                   CountTable.merge([c.gaps for c in counts]),
+                   sum(c.total for c in counts))
+
+    def remap(self, mapping):
+        ''' Translate word ids through mapping; see CountTable.remap '''
+        return NgramCounts(self.unigrams.remap(mapping, 1),
+                           self.bigrams.remap(mapping, 2),
+                           self.trigrams.remap(mapping, 3),
+                           self.gaps.remap(mapping, 2),
+                           self.total)
+
+    def table(self, n):
+        return self.bigrams if n == 2 else self.trigrams
+
+    def marginals(self, n, keys):
+        '''
+        Return counts for the n-grams in keys along with their marginals:
+        the counts of each word and, for trigrams, of each word pair
+        '''
+        words = unpack(keys, n)
+        marginals = {
+            'ngram': self.table(n).lookup(keys),
+            'unigrams': [self.unigrams.lookup(w) for w in words],
+            'total': self.total,
+        }
+        if n == 3:
+            marginals['pairs'] = [
+                self.bigrams.lookup((words[0] << ID_BITS) | words[1]),
+                self.gaps.lookup((words[0] << ID_BITS) | words[2]),
+                self.bigrams.lookup((words[1] << ID_BITS) | words[2]),
+            ]
+        return marginals
+
+
+def contingency(n, m):
+    '''
+    Observed counts of the 2^n contingency table, as nltk orders them
+    '''
+    n_i = m['ngram'].astype(float)
+    total = float(m['total'])
+    if n == 2:
+        n_ix, n_xi = m['unigrams']
+        n_io = n_ix - n_i
+        n_oi = n_xi - n_i
+        return [n_i, n_oi, n_io, total - n_i - n_oi - n_io]
+    n_iix, n_ixi, n_xii = m['pairs']
+    n_ixx, n_xix, n_xxi = m['unigrams']
+    n_oii = n_xii - n_i
+    n_ioi = n_ixi - n_i
+    n_iio = n_iix - n_i
+    n_ooi = n_xxi - n_i - n_oii - n_ioi
+    n_oio = n_xix - n_i - n_oii - n_iio
+    n_ioo = n_ixx - n_i - n_ioi - n_iio
+    n_ooo = total - n_i - n_oii - n_ioi - n_iio - n_ooi - n_oio - n_ioo
+    return [n_i, n_oii, n_ioi, n_ooi, n_iio, n_oio, n_ioo, n_ooo]
+
+
+def expected(n, cont):
+    ''' Expected counts for each cell of a contingency table '''
+    total = sum(cont)
+    bits = [1 << i for i in range(n)]
+    values = list()
+    for i in range(len(cont)):
+        product = 1.0
+        for j in bits:
+            product = product * sum(cont[x] for x in range(len(cont))
+                                    if (x & j) == (i & j))
+        values.append(product / (total ** (n - 1)))
+    return values
+
+
+def pmi(n, m):
+    ''' Pointwise mutual information '''
+    product = 1.0
+    for count in m['unigrams']:
+        product = product * count
+    return numpy.log2(m['ngram'] * float(m['total']) ** (n - 1)) - \
+        numpy.log2(product)
+
+
+def likelihood_ratio(n, m):
+    ''' Dunning's log-likelihood ratio '''
+    cont = contingency(n, m)
+    return 2 * sum(obs * numpy.log(obs / (exp + SMALL) + SMALL)
+                   for obs, exp in zip(cont, expected(n, cont)))
+
+
+def chi_sq(n, m):
+    ''' Pearson's chi-square '''
+    cont = contingency(n, m)
+    return sum((obs - exp) ** 2 / (exp + SMALL)
+               for obs, exp in zip(cont, expected(n, cont)))
+
+
+def student_t(n, m):
+    ''' Student's t-score '''
+    product = 1.0
+    for count in m['unigrams']:
+        product = product * count
+    return (m['ngram'] - product / float(m['total']) ** (n - 1)) / \
+        (m['ngram'] + SMALL) ** 0.5
+
+
+measures = {
+    'pmi': pmi,
+    'likelihood_ratio': likelihood_ratio,
+    'chi_sq': chi_sq,
+    'student_t': student_t,
+}
+
+
+def score(counts, n, names, min_freq=1):
+    '''
+    Score every n-gram counted at least min_freq times by each measure
+    in names; marginals are looked up once and shared by all measures
+    Return arrays of packed keys, their counts, and a list of score arrays
+    '''
+    table = counts.table(n).filter(min_freq)
+    m = counts.marginals(n, table.keys)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scores = [measures[name](n, m) for name in names]
+    return table.keys, table.counts, scores
+
+
+def rank(keys, scores, n, ranks):
+    '''
+    Order n-grams by descending score, ties broken alphabetically
+    Return the indices in that order
+    '''
+    words = unpack(keys, n)
+    return numpy.lexsort([ranks[w] for w in reversed(words)] + [-scores])
+
+
+def top(keys, scores, n, ranks, k):
+    '''
+    The k best n-grams in rank order, without sorting every candidate:
+    partition out the k-th best score, then rank only the n-grams
+    scoring at least that much
+    Return their indices
+    '''
+    if k >= len(scores):
+        return rank(keys, scores, n, ranks)
+    threshold = -numpy.partition(-scores, k - 1)[k - 1]
+    if numpy.isnan(threshold):
+        return rank(keys, scores, n, ranks)[:k]
+    candidates = numpy.flatnonzero(scores >= threshold)
+    return candidates[rank(keys[candidates], scores[candidates], n,
+                           ranks)][:k]
@@ -3,6 +3,8 @@ Read output from a corpus of text files
 Create bigrams, trigrams, and frequency distributions
 
 See documentation here: http://www.nltk.org/howto/collocations.html
+Counting and scoring is done by ngram_counts.py, which computes the same
+measures as nltk's collocation finders from integer-encoded count tables
 
 Mike Widner <mikewidner@stanford.edu>
 """
@@ -12,11 +14,12 @@ import csv
 import sys
 import string
 import argparse
-import collections
+import functools
+import numpy
+import ngram_counts as nc
+from concurrent.futures import ProcessPoolExecutor
 
 from nltk.corpus import PlaintextCorpusReader
-from nltk.collocations import BigramAssocMeasures, BigramCollocationFinder
-from nltk.collocations import TrigramAssocMeasures, TrigramCollocationFinder
 
 string.punctuation += "…"
 
@@ -40,6 +43,16 @@ def get_options():
     parser.add_argument('-m', '--min-measure', dest='min_measure',
                         help='Minimum ngram score to include in results',
                         default=0, type=int)
+    parser.add_argument('--measure', dest='measures', action='append',
+                        choices=sorted(nc.measures.keys()),
+                        help='''Association measure (default: pmi); repeat
+                        to add a column per measure. The first ranks the
+                        ngrams and fills the "measure" column''')
+    parser.add_argument('-c', '--corpus', dest='corpus', action='store_true',
+                        help='''Also score ngrams counted across the whole
+                        corpus, written with the prefix "corpus"''')
+    parser.add_argument('-j', '--jobs', dest='jobs', default=1, type=int,
+                        help='Number of files to score in parallel')
     group = parser.add_mutually_exclusive_group()
     group.add_argument('-b', '--bigrams-only', dest='bigrams_only',
                        action='store_true',
@@ -47,73 +60,73 @@ def get_options():
     group.add_argument('-t', '--trigrams-only', dest='trigrams_only',
                        action='store_true',
                        help='Calculate only trigrams')
-    return parser.parse_args()
-
-
-def analyze_text(text, filename, stopwords, min_length, freq,
-                 total_ngrams, min_measure, bigrams_only, trigrams_only):
-    print(len(text), filename)
-    words = [w.lower() for w in text
-             if w not in string.punctuation
-             if w.lower() not in stopwords and len(w) >= min_length]
-
-    bigrams = None
-    b_prefix_keys = None
-    trigrams = None
-    t_prefix_keys = None
-
-    # what follows could totally be generalized
+    options = parser.parse_args()
+    if not options.measures:
+        options.measures = ['pmi']
+    return options
+
+
+def filter_words(text, stopwords, min_length):
+    return [w.lower() for w in text
+            if w not in string.punctuation
+            if w.lower() not in stopwords and len(w) >= min_length]
+
+
+def score_ngrams(counts, n, vocabulary, ranks, measures, freq, total_ngrams,
+                 min_measure):
+    '''
+    Score ngrams once; derive both the top ngrams and the prefix table
+    Return the best ngrams as word tuples, and prefix rows of
+    (measure, freq, words...) grouped by first word
+    With several measures, every score follows the words
+    '''
+    keys, freqs, all_scores = nc.score(counts, n, measures, freq)
+    scores = all_scores[0]
+    words = nc.unpack(keys, n)
+    order = nc.top(keys, scores, n, ranks, total_ngrams)
+    best = list(zip(*[vocabulary.decode(w[order]) for w in words]))
+
+    order = numpy.flatnonzero(scores > min_measure)
+    order = order[nc.rank(keys[order], scores[order], n, ranks)]
+    # group by first word, in the order each first word is first seen
+    first = words[0][order]
+    uniques, seen = numpy.unique(first, return_index=True)
+    order = order[numpy.argsort(seen[numpy.searchsorted(uniques, first)],
+                                kind='mergesort')]
+    columns = [scores[order].tolist(), freqs[order].tolist()] + \
+        [vocabulary.decode(w[order]) for w in words]
+    if len(measures) > 1:
+        columns += [values[order].tolist() for values in all_scores]
+    return best, list(zip(*columns))
+
+
+def analyze_counts(counts, vocabulary, ranks, measures, freq, total_ngrams,
+                   min_measure, bigrams_only, trigrams_only):
+    results = dict()
     if not trigrams_only:
-        # Bigrams
-        print("Generating bigrams from", filename)
-        b_finder = BigramCollocationFinder.from_words(words)
-        b_finder.ngram_fd
-        b_finder.apply_freq_filter(freq)
-        # if stopwords:
-        #   b_finder.apply_word_filter(lambda w: w in stopwords)
-        bigrams = b_finder.nbest(BigramAssocMeasures.pmi, total_ngrams)
-        b_scored = b_finder.score_ngrams(BigramAssocMeasures.pmi)
-        b_prefix_keys = collections.defaultdict(list)
-        for key, scores in b_scored:
-            if scores > min_measure:
-                b_prefix_keys[key[0]].append((key[1], scores))
-
-    # Trigrams
+        results['bigrams'], results['b_prefix'] = score_ngrams(
+            counts, 2, vocabulary, ranks, measures, freq, total_ngrams,
+            min_measure)
     if not bigrams_only:
-        print("Generating trigrams from", filename)
-        t_finder = TrigramCollocationFinder.from_words(words)
-        t_finder.apply_freq_filter(freq)
-        # if stopwords:
-        #   t_finder.apply_word_filter(lambda w: w in stopwords)
-        trigrams = t_finder.nbest(TrigramAssocMeasures.pmi, total_ngrams)
-        t_scored = t_finder.score_ngrams(TrigramAssocMeasures.pmi)
-        t_prefix_keys = collections.defaultdict(list)
-        for key, scores in t_scored:
-            if scores > min_measure:
-                t_prefix_keys[key[0]].append((key[1], key[2], scores))
-
-    if bigrams_only:
-        ret = {'bigrams': bigrams, 'b_prefix': b_prefix_keys,
-               'b_fd': b_finder.ngram_fd}
-    elif trigrams_only:
-        ret = {'trigrams': trigrams, 't_prefix': t_prefix_keys,
-               't_fd': t_finder.ngram_fd}
-    else:
-        ret = {'bigrams': bigrams, 'b_prefix': b_prefix_keys,
-               'b_fd': b_finder.ngram_fd,
-               'trigrams': trigrams, 't_prefix': t_prefix_keys,
-               't_fd': t_finder.ngram_fd}
-    return ret
+        results['trigrams'], results['t_prefix'] = score_ngrams(
+            counts, 3, vocabulary, ranks, measures, freq, total_ngrams,
+            min_measure)
+    return results
 
 
 def get_stopwords(filename):
     fh = open(filename, 'r')
     stopwords = fh.read()
     fh.close()
-    return stopwords.split()
+    return set(stopwords.split())
+
 
+def extra_columns(measures):
+    ''' A named column per measure, when there is more than one '''
+    return list(measures) if len(measures) > 1 else []
 
-def write_results(results, prefix, bigrams_only, trigrams_only):
+
+def write_results(results, prefix, bigrams_only, trigrams_only, measures):
     filename = os.path.splitext(os.path.basename(prefix))[0]
     outdir = os.path.dirname(prefix)
     prefix = os.path.join(outdir, filename)
@@ -123,13 +136,12 @@ def write_results(results, prefix, bigrams_only, trigrams_only):
         for bigram in results['bigrams']:
             fh.write(' '.join(bigram) + "\n")
         fh.close()
-        fh = csv.writer(open(prefix + '-bigram_prefix.csv', 'w',
-                        encoding='utf-8'), dialect='excel')
-        fh.writerow(['measure', 'freq', 'first', 'second'])
-        for key in results['b_prefix']:
-            for item in results['b_prefix'][key]:
-                fh.writerow([item[1], results['b_fd'][(key, item[0])],
-                            key, item[0]])
+        with open(prefix + '-bigram_prefix.csv', 'w',
+                  encoding='utf-8') as f:
+            fh = csv.writer(f, dialect='excel')
+            fh.writerow(['measure', 'freq', 'first', 'second'] +
+                        extra_columns(measures))
+            fh.writerows(results['b_prefix'])
 
     # Trigrams
     if not bigrams_only:
@@ -137,13 +149,33 @@ def write_results(results, prefix, bigrams_only, trigrams_only):
         for trigram in results['trigrams']:
             fh.write(' '.join(trigram) + "\n")
         fh.close()
-        fh = csv.writer(open(prefix + '-trigram_prefix.csv', 'w',
-                        encoding='utf-8'))
-        fh.writerow(['measure', 'freq', 'first', 'second', 'third'])
-        for key in results['t_prefix']:
-            for item in results['t_prefix'][key]:
-                fh.writerow([item[2], results['t_fd'][(key, item[0], item[1])],
-                            key, item[0], item[1]])
+        with open(prefix + '-trigram_prefix.csv', 'w',
+                  encoding='utf-8') as f:
+            fh = csv.writer(f)
+            fh.writerow(['measure', 'freq', 'first', 'second', 'third'] +
+                        extra_columns(measures))
+            fh.writerows(results['t_prefix'])
+
+
+def process_file(fileid, options, stopwords):
+    '''
+    Count, score and write the results for a single file
+    Return the file's vocabulary and counts for corpus-wide scoring
+    '''
+    text = PlaintextCorpusReader(options.input, [fileid]).words(fileid)
+    print(len(text), fileid)
+    vocabulary = nc.Vocabulary()
+    ids = vocabulary.encode(filter_words(text, stopwords, options.min_length))
+    counts = nc.NgramCounts.from_ids(ids)
+    results = analyze_counts(counts, vocabulary, vocabulary.ranks(),
+                             options.measures, options.min_freq,
+                             options.total_ngrams, options.min_measure,
+                             options.bigrams_only, options.trigrams_only)
+    write_results(results, os.path.join(options.output, fileid),
+                  options.bigrams_only, options.trigrams_only,
+                  options.measures)
+    if options.corpus:
+        return vocabulary.words, counts
 
 
 def main():
@@ -153,18 +185,43 @@ def main():
 
     wordlists = PlaintextCorpusReader(options.input, '.*\.txt$')
 
-    stopwords = list()
+    stopwords = set()
     if options.stopwords:
         stopwords = get_stopwords(options.stopwords)
 
-    for fileid in wordlists.fileids():
-        results = analyze_text(wordlists.words(fileid), fileid,
-                               stopwords, options.min_length,
-                               options.min_freq, options.total_ngrams,
-                               options.min_measure, options.bigrams_only,
-                               options.trigrams_only)
-        write_results(results, os.path.join(options.output, fileid),
-                      options.bigrams_only, options.trigrams_only)
+    process = functools.partial(process_file, options=options,
+                                stopwords=stopwords)
+    if options.jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=options.jobs)
+        file_results = executor.map(process, wordlists.fileids())
+    else:
+        executor = None
+        file_results = map(process, wordlists.fileids())
+
+    vocabulary = nc.Vocabulary()
+    corpus_counts = nc.NgramCounts.merge([])
+    pending = list()
+    for file_result in file_results:
+        if file_result is None:
+            continue
+        words, counts = file_result
+        pending.append(counts.remap(vocabulary.encode(words)))
+        if len(pending) >= 64:  # merge in batches to bound memory
+            corpus_counts = nc.NgramCounts.merge([corpus_counts] + pending)
+            pending = list()
+    if executor is not None:
+        executor.shutdown()
+
+    if options.corpus:
+        print("Scoring ngrams across the corpus")
+        corpus_counts = nc.NgramCounts.merge([corpus_counts] + pending)
+        results = analyze_counts(corpus_counts, vocabulary, vocabulary.ranks(),
+                                 options.measures, options.min_freq,
+                                 options.total_ngrams, options.min_measure,
+                                 options.bigrams_only, options.trigrams_only)
+        write_results(results, os.path.join(options.output, 'corpus'),
+                      options.bigrams_only, options.trigrams_only,
+                      options.measures)
 
 
 if __name__ == '__main__':
@@ -8,7 +8,7 @@ Mike Widner <mikewidner@stanford.edu>
 import sys
 import csv
 import argparse
-import networkx as nx
+import graph_writer
 
 
 def get_options():
@@ -17,7 +17,8 @@ def get_options():
     parser.add_argument('-i', '--input', dest='input', action='append',
                         required=True, help='Input file of ngram CSV measures')
     parser.add_argument('-o', '--output', dest='output', required=True,
-                        help='Output directory for results')
+                        help='''Output file for the graph: .gexf, .graphml,
+                        or .edges for a binary edge list''')
     parser.add_argument('-n', '--label', dest='label', action='append',
                         help='Labels')
     return parser.parse_args()
@@ -25,53 +26,42 @@ def get_options():
 
 def parse_ngram_csv(filename):
     '''
-    Read in a CSV of ngrams with their measures as the first column
-    Return a dict with the information
+    Read in a CSV of ngrams with their measures
+    Yield (measure, ngram) pairs one row at a time
     '''
-    results = dict()
-    fh = open(filename, 'r')
-    reader = csv.reader(fh)
-    next(reader, None)  # skip header
-    for row in reader:
-        # TODO: Rewrite so it understands column names!
-        results[row[0]] = ' '.join(row[2:])
-    fh.close()
-    return(results)
+    with open(filename, 'r') as fh:
+        reader = csv.DictReader(fh)
+        for row in reader:
+            words = [row[col] for col in ['first', 'second', 'third']
+                     if row.get(col)]
+            yield row['measure'], ' '.join(words)
 
 
-def write_graph_file(outfile, ngrams, labels):
+def write_graph_file(outfile, filenames, labels):
     '''
-    Generate the network graph and write it
+    Stream the network graph to outfile, one input file at a time
     '''
-    G = nx.DiGraph()
-    for filename in ngrams.keys():
-        # TODO: Generate nice labels automatically
-        G.add_node(labels[filename], label=labels[filename])
-        G.add_nodes_from([ngram for ngram in ngrams[filename].values()])
-        for item in ngrams[filename].items():
-            G.add_edge(labels[filename], item[1], weight=item[0])
-        try:
-            nx.write_gexf(G, outfile)
-        except Exception as err:
-            print("Could not write graphfile", outfile, err)
+    try:
+        with graph_writer.open_graph(outfile, directed=True) as graph:
+            for filename in filenames:
+                # TODO: Generate nice labels automatically
+                graph.add_node(labels[filename], label=labels[filename])
+                for measure, ngram in parse_ngram_csv(filename):
+                    graph.add_edge(labels[filename], ngram, weight=measure)
+    except Exception as err:
+        print("Could not write graphfile", outfile, err)
 
 
 def main():
     options = get_options()
-    ngrams = dict()
     labels = dict()
 
-    if isinstance(options.input, list):
-        for filename in options.input:
-            if options.label:
-                labels[filename] = options.label.pop(0)
-            else:
-                labels[filename] = filename
-            ngrams[filename] = parse_ngram_csv(filename)
-    else:
-        labels[options.input] = options.input
-        ngrams[options.input] = parse_ngram_csv(options.input)
-    write_graph_file(options.output, ngrams, labels)
+    for filename in options.input:
+        if options.label:
+            labels[filename] = options.label.pop(0)
+        else:
+            labels[filename] = filename
+    write_graph_file(options.output, options.input, labels)
 
 
 if __name__ == '__main__':
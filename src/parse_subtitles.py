@@ -1,19 +1,150 @@
 '''
 Read subtitle files
 Write as plain text
+
+Give -i a single .srt or .vtt file and -o the text file to write, or
+-i a directory of subtitle files and -o a directory: every file is then
+parsed on a process pool, and a metadata row for each (duration in
+seconds, cue count, word count) goes to metadata.csv in the output
+directory, or the file given with -m.
+
+Cues are streamed from the subtitle file straight to the text file.
+Files are read as UTF-8 (with or without a BOM) unless -e names
+another encoding; files that can't be read or decoded are reported
+and skipped.
 '''
 
+import os
+import re
+import sys
 import pysrt
 import argparse
+import itertools
+import metadata
+from concurrent.futures import ProcessPoolExecutor
+
+extensions = ('.srt', '.vtt')
+word_pattern = re.compile(r'\w+')
+vtt_timing = re.compile(r'((?:\d+:)?\d{2}:\d{2}[.,]\d{3})\s+-->\s+((?:\d+:)?\d{2}:\d{2}[.,]\d{3})')
+vtt_tag = re.compile(r'<[^>]*>')
+
+
+def get_settings():
+  parser = argparse.ArgumentParser(description='Extract text from subtitle files')
+  parser.add_argument('-i', dest='input_file', required=True, help='Input file, or directory of subtitle files' )
+  parser.add_argument('-o', dest='output_file', required=True,
+                     help='Output file, or output directory when the input is a directory')
+  parser.add_argument('-m', '--metadata', dest='metadata', help='Metadata CSV for a directory; defaults to metadata.csv in the output directory')
+  parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None, help='Number of processes for a directory')
+  parser.add_argument('-e', '--encoding', dest='encoding', default='utf-8-sig', help='Encoding of the subtitle files (default: %(default)s)')
+  return parser.parse_args()
+
+def vtt_time(timestamp):
+  ''' Convert a WebVTT timestamp to milliseconds '''
+  parts = timestamp.replace(',', '.').split(':')
+  hours = int(parts[0]) if len(parts) == 3 else 0
+  seconds = float(parts[-1])
+  return (hours * 3600 + int(parts[-2]) * 60) * 1000 + int(round(seconds * 1000))
+
+def vtt_cue(block):
+  '''
+  Return (start, end, text) for a block of lines, or None if the block
+  is a header, note or style block rather than a cue
+  '''
+  for i, line in enumerate(block[:2]):
+    match = vtt_timing.search(line)
+    if match:
+      text = '\n'.join(vtt_tag.sub('', l) for l in block[i + 1:])
+      return vtt_time(match.group(1)), vtt_time(match.group(2)), text
+  return None
+
+def stream_vtt(lines):
+  ''' Yield (start, end, text) for each cue of a WebVTT file '''
+  block = list()
+  for line in itertools.chain(lines, ['']):
+    line = line.rstrip('\r\n')
+    if line.strip():
+      block.append(line)
+    elif block:
+      cue = vtt_cue(block)
+      if cue is not None:
+        yield cue
+      block = list()
+
+def stream_srt(lines):
+  ''' Yield (start, end, text) for each cue of a SubRip file '''
+  for item in pysrt.stream(lines):
+    yield item.start.ordinal, item.end.ordinal, item.text
+
+def read_cues(filename, f):
+  if filename.lower().endswith('.vtt'):
+    return stream_vtt(f)
+  return stream_srt(f)
+
+def parse_file(input_file, output_file, encoding='utf-8-sig'):
+  '''
+  Write the text of every cue to output_file, one cue per line
+  Return the file's metadata, or None if it couldn't be parsed,
+  in which case no text file is left behind
+  '''
+  cues = words = duration = 0
+  dirname = os.path.dirname(output_file)
+  if len(dirname) and not os.path.isdir(dirname):
+    os.makedirs(dirname, exist_ok=True)
+  try:
+    with open(input_file, encoding=encoding) as f, open(output_file, 'w') as out:
+      for start, end, text in read_cues(input_file, f):
+        if cues:
+          out.write('\n')
+        out.write(text)
+        cues += 1
+        words += len(word_pattern.findall(text))
+        duration = max(duration, end)
+  except (OSError, UnicodeError, ValueError) as err:
+    print('Skipping {}: {}'.format(input_file, err), file=sys.stderr)
+    if os.path.isfile(output_file):
+      os.remove(output_file)
+    return None
+  return {
+    'filename': output_file,
+    'source': input_file,
+    'title': os.path.splitext(os.path.basename(input_file))[0],
+    'duration': '{:.3f}'.format(duration / 1000),
+    'cues': cues,
+    'word_count': words,
+  }
+
+def find_subtitles(directory):
+  filenames = list()
+  for root, dirs, files in os.walk(directory):
+    filenames.extend(os.path.join(root, f) for f in files if f.lower().endswith(extensions))
+  return sorted(filenames)
 
+def text_filename(input_dir, output_dir, filename):
+  relative = os.path.relpath(filename, input_dir)
+  return os.path.join(output_dir, os.path.splitext(relative)[0] + '.txt')
 
-parser = argparse.ArgumentParser(description='Extract text from subtitle files')
-parser.add_argument('-i', dest='input_file', required=True, help='Input file' )
-parser.add_argument('-o', dest='output_file', required=True,
-                   help='Output file')
-args = parser.parse_args()
+def parse_directory(input_dir, output_dir, jobs=None, encoding='utf-8-sig'):
+  '''
+  Parse every subtitle file under input_dir in parallel
+  Return metadata rows for the files that parsed
+  '''
+  inputs = find_subtitles(input_dir)
+  outputs = [text_filename(input_dir, output_dir, f) for f in inputs]
+  with ProcessPoolExecutor(max_workers=jobs) as executor:
+    rows = executor.map(parse_file, inputs, outputs, [encoding] * len(inputs), chunksize=4)
+    return [row for row in rows if row is not None]
 
-subs = pysrt.open(args.input_file)
-with open(args.output_file, 'w') as f:
-  f.write(subs.text)
+def main():
+  settings = get_settings()
+  if os.path.isdir(settings.input_file):
+    rows = parse_directory(settings.input_file, settings.output_file, settings.jobs, settings.encoding)
+    metadata.write_csv(settings.metadata or os.path.join(settings.output_file, 'metadata.csv'), rows)
+  elif parse_file(settings.input_file, settings.output_file, settings.encoding) is None:
+    exit(-1)
 
+if __name__ == '__main__':
+  if sys.version_info[0] != 3:
+    print("This program requires Python 3.")
+    exit(-1)
+  main()
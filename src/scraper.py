@@ -0,0 +1,179 @@
+'''
+Library for polite, cached, concurrent page fetching
+
+A Fetcher downloads pages on a thread pool through one pooled HTTP
+session, with at most a few requests in flight per host. Responses are
+kept in an on-disk cache keyed by URL; a cached page is revalidated
+with its ETag or Last-Modified header, so re-running a scrape only
+downloads pages that changed.
+
+  with Fetcher('cache', jobs=8, per_host=2) as fetcher:
+    pages = fetcher.fetch_all(urls)
+
+Paginated listings are followed concurrently with Fetcher.crawl.
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+
+import os
+import json
+import hashlib
+import threading
+import collections
+import requests
+from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class Page(object):
+  '''
+  A fetched page; cached is True when it came from the cache unchanged
+  '''
+  def __init__(self, url, content, encoding=None, cached=False):
+    self.url = url
+    self.content = content
+    self.encoding = encoding
+    self.cached = cached
+
+  @property
+  def text(self):
+    return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+class HTTPCache(object):
+  '''
+  Response bodies and their validators, stored under directory
+  as <sha1 of url>.body and .json
+  '''
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+  def path(self, url):
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(self.directory, key[:2], key)
+
+  def get(self, url):
+    '''
+    Return (metadata, body) for a cached url, or None
+    '''
+    path = self.path(url)
+    try:
+      with open(path + '.json') as f:
+        meta = json.load(f)
+      with open(path + '.body', 'rb') as f:
+        return meta, f.read()
+    except (OSError, ValueError):
+      return None
+
+  def put(self, url, response):
+    path = self.path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = {
+      'url': url,
+      'etag': response.headers.get('ETag'),
+      'last_modified': response.headers.get('Last-Modified'),
+      'encoding': response.encoding,
+    }
+    # Body first, then metadata, so a metadata file always has its body
+    # Temporary names are per thread: the same url may be fetched twice at once
+    for suffix, mode, data in (('.body', 'wb', response.content),
+                               ('.json', 'w', json.dumps(meta))):
+      tmpfile = '{}{}.{}-{}.tmp'.format(path, suffix, os.getpid(), threading.get_ident())
+      with open(tmpfile, mode) as f:
+        f.write(data)
+      os.replace(tmpfile, path + suffix)
+
+def validators(meta):
+  ''' Conditional request headers for a cached response '''
+  headers = dict()
+  if meta.get('etag'):
+    headers['If-None-Match'] = meta['etag']
+  if meta.get('last_modified'):
+    headers['If-Modified-Since'] = meta['last_modified']
+  return headers
+
+class Fetcher(object):
+  '''
+  Concurrent page fetcher with a per-host limit and an optional cache
+  stats counts pages downloaded and pages revalidated from the cache
+  '''
+  def __init__(self, cache_dir=None, jobs=8, per_host=2, retries=3, timeout=30):
+    self.cache = HTTPCache(cache_dir) if cache_dir else None
+    self.per_host = per_host
+    self.timeout = timeout
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=jobs, pool_maxsize=jobs, max_retries=retry)
+    self.session = requests.Session()
+    self.session.mount('http://', adapter)
+    self.session.mount('https://', adapter)
+    self.executor = ThreadPoolExecutor(max_workers=jobs)
+    self.hosts = dict()
+    self.lock = threading.Lock()
+    self.stats = collections.Counter()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    self.executor.shutdown()
+    self.session.close()
+
+  def host_limit(self, url):
+    host = urlparse(url).netloc
+    with self.lock:
+      if host not in self.hosts:
+        self.hosts[host] = threading.BoundedSemaphore(self.per_host)
+      return self.hosts[host]
+
+  def fetch(self, url):
+    '''
+    Return the Page at url, from the cache if it hasn't changed
+    '''
+    cached = self.cache.get(url) if self.cache else None
+    headers = validators(cached[0]) if cached else {}
+    with self.host_limit(url):
+      r = self.session.get(url, headers=headers, timeout=self.timeout)
+    if r.status_code == 304 and cached:
+      with self.lock:
+        self.stats['revalidated'] += 1
+      return Page(url, cached[1], cached[0]['encoding'], cached=True)
+    r.raise_for_status()
+    if self.cache:
+      self.cache.put(url, r)
+    with self.lock:
+      self.stats['downloaded'] += 1
+    return Page(url, r.content, r.encoding)
+
+  def submit(self, url):
+    ''' Fetch url on the pool; return a future of its Page '''
+    return self.executor.submit(self.fetch, url)
+
+  def fetch_all(self, urls):
+    ''' Fetch urls concurrently; return their Pages in the same order '''
+    return [future.result() for future in [self.submit(url) for url in urls]]
+
+  def crawl(self, urls, parse_listing):
+    '''
+    Follow paginated listings concurrently, starting from urls
+    parse_listing(page) returns (items, links): items are yielded as
+    each listing is parsed, links to other listing pages are fetched
+    once each, relative to the page they were found on
+    '''
+    seen = set(urls)
+    pending = {self.submit(url) for url in urls}
+    while pending:
+      done, pending = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        page = future.result()
+        items, links = parse_listing(page)
+        for link in links:
+          link = urljoin(page.url, link)
+          if link not in seen:
+            seen.add(link)
+            pending.add(self.submit(link))
+        for item in items:
+          yield item
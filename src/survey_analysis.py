@@ -1,7 +1,6 @@
 import os
+import re
 import csv
-import nltk
-import statistics
 import argparse
 
 settings = None
@@ -10,35 +9,64 @@ def get_settings():
   parser = argparse.ArgumentParser(description='Split CSV into text by column')
   parser.add_argument('-i', dest='inputfile', required=True, help='The CSV file to read')
   parser.add_argument('-o', dest='outputdir', required=True, help='Output directory')
-  parser.add_argument('-s', dest='skip', action='append', help='Columns to skip, in lowercase')
+  parser.add_argument('-s', dest='skip', action='append', default=[], help='Columns to skip, in lowercase')
   return parser.parse_args()
 
-def calc_stats(column_data):
-  ''' Calculate average words, most words in a column '''
-  word_counts = list()
-  word_tokenizer = nltk.tokenize.WordPunctTokenizer()
-  for row in column_data:
-    word_counts.append(len(word_tokenizer.tokenize(row)))
-  return {'avg': statistics.mean(word_counts), 'max': max(word_counts)}
+# Same tokens as nltk's WordPunctTokenizer
+word_punct = re.compile(r'\w+|[^\w\s]+')
 
-def column_lists(inputfile):
-  ''' Convert CSV into lists by column '''
-  columns = dict()
-  with open(settings.inputfile) as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-      for key, value in row.items():
-        if key not in columns:
-          columns[key] = list()
-        columns[key].append(value)
-  return columns
+def count_words(text):
+  return len(word_punct.findall(text))
 
-def write_text(data, outputdir, filename):
-  outfile = os.path.join(outputdir, filename)
+class ColumnStats(object):
+  ''' Running average words, most words in a column '''
+  def __init__(self):
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def add(self, text):
+    words = count_words(text)
+    self.count += 1
+    self.total += words
+    self.max = max(self.max, words)
+
+  def result(self):
+    # match statistics.mean: an int when the mean is whole
+    if self.total % self.count:
+      avg = self.total / self.count
+    else:
+      avg = self.total // self.count
+    return {'avg': avg, 'max': self.max}
+
+def split_columns(inputfile, outputdir, skip):
+  '''
+  Stream the CSV once, appending each cell to its column's text file
+  and updating that column's statistics as we go
+  Only one row is held in memory at a time
+  '''
   if not os.path.isdir(outputdir):
     os.makedirs(outputdir)
-  with open(outfile, 'w') as f:
-    f.write('\n'.join(data))
+  files = dict()
+  stats = dict()
+  try:
+    with open(inputfile) as csvfile:
+      reader = csv.DictReader(csvfile)
+      for row in reader:
+        for key, value in row.items():
+          if key is None or key.lower() in skip:
+            continue
+          if key in files:
+            files[key].write('\n')
+          else:
+            files[key] = open(os.path.join(outputdir, key.lower()), 'w')
+            stats[key] = ColumnStats()
+          files[key].write(value)
+          stats[key].add(value)
+  finally:
+    for f in files.values():
+      f.close()
+  return {column: stats[column].result() for column in stats}
 
 def write_stats(data, outputdir):
   outfile = os.path.join(outputdir, 'statistics.csv')
@@ -51,12 +79,7 @@ def write_stats(data, outputdir):
 def main():
   global settings
   settings = get_settings()
-  data = column_lists(settings.inputfile)
-  stats = dict()
-  for column in data.keys():
-    if column.lower() not in settings.skip:
-      stats[column] = calc_stats(data[column])
-      write_text(data[column], settings.outputdir, column.lower())
+  stats = split_columns(settings.inputfile, settings.outputdir, settings.skip)
   write_stats(stats, settings.outputdir)
 
 
@@ -0,0 +1,233 @@
+'''
+Inverted index over a tweet CSV export
+
+For every hashtag, mentioned account and posting account, the index
+keeps a postings list of the rows that contain it, along with each
+row's byte offset in the CSV and the rows sorted by date. Filters are
+answered by intersecting postings and seeking straight to the matching
+rows, instead of scanning the whole file.
+
+The index is one numpy .npz file:
+  offsets           byte offset of each row in the CSV
+  dates, by_date    row dates (YYYY-MM-DD) in sorted order, and their rows
+  <kind>_terms      sorted terms for kind hashtag, mention and account
+  <kind>_indptr     postings of terms[i] are postings[indptr[i]:indptr[i+1]]
+  <kind>_postings   row numbers, sorted within each term
+  fieldnames, source_size, source_mtime
+
+Usage:
+  python tweet_index.py -i corpus/tweets/all_twitter_data.csv -o tweets.npz
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+import os
+import csv
+import sys
+import argparse
+import collections
+import numpy as np
+import tweet_processing as tp
+
+kinds = ('hashtag', 'mention', 'account')
+csv_options = dict(skipinitialspace=True, delimiter=',', quotechar='|')
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description='Index tweets by hashtag, mention, account and date')
+    parser.add_argument('-i', dest='input', required=True,
+                        help='Input file as CSV where tweet data exists')
+    parser.add_argument('-o', dest='output', required=True,
+                        help='Index file to write (.npz)')
+    return parser.parse_args()
+
+
+def read_records(f):
+    '''
+    Yield (offset, row) for each CSV record in a binary file,
+    where offset is the byte position the record starts at
+    Line endings are translated as open() does in text mode
+    '''
+    position = [f.tell()]
+
+    def lines():
+        for line in f:
+            position[0] += len(line)
+            line = line.decode('utf-8')
+            yield line.replace('\r\n', '\n').replace('\r', '\n')
+    reader = csv.reader(lines(), **csv_options)
+    while True:
+        offset = position[0]
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        if row:
+            yield offset, row
+
+
+def row_terms(tweet):
+    ''' Return the terms of each kind a tweet is indexed under '''
+    return {
+        'hashtag': tp.hashtags(tweet['text']),
+        'mention': tp.mentions(tweet['text']),
+        'account': {tweet['name'].lower()},
+    }
+
+
+def postings_arrays(postings):
+    '''
+    Convert a dict of term -> list of rows into sorted terms,
+    indptr and postings arrays
+    '''
+    terms = sorted(postings)
+    lengths = [len(postings[term]) for term in terms]
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    rows = [row for term in terms for row in postings[term]]
+    return (np.array(terms, dtype=str), indptr,
+            np.array(rows, dtype=np.uint32))
+
+
+def build_index(filename, index_file):
+    '''
+    Scan a tweet CSV once and write its index to index_file
+    '''
+    offsets = list()
+    dates = list()
+    postings = {kind: collections.defaultdict(list) for kind in kinds}
+    with open(filename, 'rb') as f:
+        records = read_records(f)
+        fieldnames = next(records)[1]
+        for row, (offset, values) in enumerate(records):
+            tweet = dict(zip(fieldnames, values))
+            offsets.append(offset)
+            dates.append(tweet['created_at'][:10])
+            for kind, terms in row_terms(tweet).items():
+                for term in terms:
+                    postings[kind][term].append(row)
+    dates = np.array(dates, dtype=str)
+    by_date = np.argsort(dates, kind='mergesort').astype(np.uint32)
+    arrays = dict()
+    for kind in kinds:
+        terms, indptr, rows = postings_arrays(postings[kind])
+        arrays[kind + '_terms'] = terms
+        arrays[kind + '_indptr'] = indptr
+        arrays[kind + '_postings'] = rows
+    stat = os.stat(filename)
+    with open(index_file, 'wb') as f:
+        np.savez_compressed(f, offsets=np.array(offsets, dtype=np.int64),
+                            dates=dates[by_date], by_date=by_date,
+                            fieldnames=np.array(fieldnames, dtype=str),
+                            source_size=stat.st_size,
+                            source_mtime=stat.st_mtime, **arrays)
+
+
+class TweetIndex(object):
+    '''
+    An index written by build_index, opened against its CSV
+    '''
+
+    def __init__(self, index_file, filename):
+        self.filename = filename
+        store = np.load(index_file)
+        self.store = {key: store[key] for key in store.files}
+        self.fieldnames = self.store['fieldnames'].tolist()
+        self.offsets = self.store['offsets']
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def is_current(self):
+        ''' True if the CSV hasn't changed since the index was built '''
+        stat = os.stat(self.filename)
+        return (stat.st_size == self.store['source_size'] and
+                stat.st_mtime == self.store['source_mtime'])
+
+    def term_rows(self, kind, term, prefix=False):
+        '''
+        Rows indexed under term, or under any term starting with it
+        '''
+        terms = self.store[kind + '_terms']
+        indptr = self.store[kind + '_indptr']
+        rows = self.store[kind + '_postings']
+        first = np.searchsorted(terms, term, side='left')
+        if prefix:
+            last = np.searchsorted(terms, term + '\U0010ffff', side='left')
+        else:
+            last = first + int(first < len(terms) and terms[first] == term)
+        if last - first == 1:
+            return rows[indptr[first]:indptr[last]]
+        return np.unique(rows[indptr[first]:indptr[last]])
+
+    def date_rows(self, start=None, end=None):
+        ''' Rows dated between start and end, inclusive, in row order '''
+        dates = self.store['dates']
+        first = 0 if start is None else np.searchsorted(dates, start, 'left')
+        last = len(dates) if end is None else \
+            np.searchsorted(dates, end, 'right')
+        return np.sort(self.store['by_date'][first:last])
+
+    def query(self, start=None, end=None, hashtag=None, mention=None,
+              account=None):
+        '''
+        Return sorted row numbers matching every filter given
+        Hashtags match by prefix, as tweet_processing.filter_batch does
+        '''
+        selections = list()
+        if hashtag is not None:
+            selections.append(self.term_rows('hashtag', hashtag.lower(), True))
+        if mention is not None:
+            selections.append(self.term_rows('mention', mention.lower()))
+        if account is not None:
+            selections.append(self.term_rows('account', account.lower()))
+        if start is not None or end is not None:
+            selections.append(self.date_rows(start, end))
+        if not selections:
+            return np.arange(len(self.offsets), dtype=np.uint32)
+        selections.sort(key=len)
+        rows = selections[0]
+        for other in selections[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def read_rows(self, rows, size=tp.BATCH_SIZE):
+        '''
+        Seek to each row and yield the tweets in batches of size
+        '''
+        batch = list()
+        with open(self.filename, 'rb') as f:
+            for row in rows:
+                f.seek(self.offsets[row])
+                offset, values = next(read_records(f))
+                batch.append(dict(zip(self.fieldnames, values)))
+                if len(batch) >= size:
+                    yield batch
+                    batch = list()
+        if batch:
+            yield batch
+
+
+def open_index(index_file, filename):
+    '''
+    Open the index for filename, building it first if it is
+    missing or older than the CSV
+    '''
+    if os.path.exists(index_file):
+        index = TweetIndex(index_file, filename)
+        if index.is_current():
+            return index
+    build_index(filename, index_file)
+    return TweetIndex(index_file, filename)
+
+
+def main():
+    options = get_options()
+    build_index(options.input, options.output)
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] != 3:
+        print("This program requires Python 3.")
+        exit(-1)
+    main()
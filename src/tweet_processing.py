@@ -0,0 +1,152 @@
+'''
+Batch processing of tweets from our CSV exports
+
+Tweets are read and filtered in batches of rows. Patterns are compiled
+once, dates are compared as ISO strings without parsing, and each
+tweet's hashtags are extracted once.
+
+Run directly to benchmark throughput on a tweet CSV:
+  python tweet_processing.py -i corpus/tweets/all_twitter_data.csv
+
+Mike Widner <mikewidner@stanford.edu>
+'''
+import re
+import csv
+import sys
+import time
+import argparse
+import itertools
+
+url_pattern = re.compile(r'https?:\/{2}[\d\w-]+(\.[\d\w-]+)*(?:(?:\/[^\s/]*))*',
+                         flags=re.MULTILINE)
+hashtag_pattern = re.compile(r'#(\w+)', flags=re.MULTILINE)
+mention_pattern = re.compile(r'@(\w+)')
+
+BATCH_SIZE = 10000
+
+
+def get_options():
+    parser = argparse.ArgumentParser(
+        description='Benchmark tweet batch processing')
+    parser.add_argument('-i', dest='input', required=True,
+                        help='Input file as CSV where tweet data exists')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=5,
+                        help='Number of timed runs')
+    parser.add_argument('--hashtag', dest='hashtag', default='cop21',
+                        help='Hashtag to filter on while timing')
+    return parser.parse_args()
+
+
+def read_batches(filename, size=BATCH_SIZE):
+    '''
+    Yield lists of up to size tweets from a CSV file
+    '''
+    with open(filename) as csvfile:
+        reader = csv.DictReader(csvfile, skipinitialspace=True,
+                                delimiter=',', quotechar="|")
+        while True:
+            batch = list(itertools.islice(reader, size))
+            if not batch:
+                break
+            yield batch
+
+
+def hashtags(text):
+    ''' Return the set of lowercased hashtags in a tweet '''
+    return set(hashtag_pattern.findall(text.lower()))
+
+
+def mentions(text):
+    ''' Return the set of lowercased accounts mentioned in a tweet '''
+    return set(mention_pattern.findall(text.lower()))
+
+
+def has_hashtag(tags, hashtag):
+    '''
+    True if any tag starts with hashtag (lowercased, without the #),
+    matching the substring search tweets_to_text always used
+    '''
+    return any(tag.startswith(hashtag) for tag in tags)
+
+
+def filter_batch(batch, start=None, end=None, hashtag=None, mention=None,
+                 account=None):
+    '''
+    Keep tweets created between start and end (YYYY-MM-DD, inclusive)
+    and, if given, using hashtag (without the #), mentioning mention
+    (without the @) and posted by account
+    '''
+    if start is not None or end is not None:
+        start = start or '0000-00-00'
+        end = end or '9999-99-99'
+        batch = [tweet for tweet in batch
+                 if start <= tweet['created_at'][:10] <= end]
+    if hashtag is not None:
+        hashtag = hashtag.lower()
+        batch = [tweet for tweet in batch
+                 if has_hashtag(hashtags(tweet['text']), hashtag)]
+    if mention is not None:
+        mention = mention.lower()
+        batch = [tweet for tweet in batch
+                 if mention in mentions(tweet['text'])]
+    if account is not None:
+        account = account.lower()
+        batch = [tweet for tweet in batch if tweet['name'].lower() == account]
+    return batch
+
+
+def clean_text(text):
+    ''' Remove all URLs and hashtags '''
+    return hashtag_pattern.sub('', url_pattern.sub('', text))
+
+
+def batch_text(batch, clean=False):
+    ''' Return the text of a batch of tweets, one line per tweet '''
+    if clean:
+        return ''.join(clean_text(tweet['text']) + '\n' for tweet in batch)
+    return ''.join(tweet['text'] + '\n' for tweet in batch)
+
+
+def process(batches, start=None, end=None, hashtag=None, clean=False):
+    '''
+    Filter batches of tweets and yield their text, batch by batch
+    '''
+    for batch in batches:
+        batch = filter_batch(batch, start, end, hashtag)
+        if batch:
+            yield batch_text(batch, clean)
+
+
+def benchmark(filename, repeat, hashtag):
+    '''
+    Time the full pipeline, with and without filters and cleaning
+    '''
+    runs = [
+        ('read only', {}),
+        ('date filter', {'start': '2015-11-01', 'end': '2015-12-31'}),
+        ('hashtag filter', {'hashtag': hashtag}),
+        ('clean', {'clean': True}),
+    ]
+    tweets = sum(len(batch) for batch in read_batches(filename))
+    for name, kwargs in runs:
+        times = list()
+        for i in range(repeat):
+            started = time.perf_counter()
+            for text in process(read_batches(filename), **kwargs):
+                pass
+            times.append(time.perf_counter() - started)
+        best = min(times)
+        print('{:<15} {:>8.3f}s  {:>12,.0f} tweets/s'.format(
+            name, best, tweets / best if best else float('inf')))
+
+
+def main():
+    options = get_options()
+    benchmark(options.input, options.repeat, options.hashtag.lower())
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] != 3:
+        print("This program requires Python 3.")
+        exit(-1)
+    main()
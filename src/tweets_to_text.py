@@ -8,88 +8,99 @@ Mike Widner <mikewidner@stanford.edu>
 '''
 import os
 import re
-import csv
 import sys
-import time
 import datetime
 import argparse
+import tweet_index as ti
+import tweet_processing as tp
+
+def date_type(value):
+	'''
+	Dates are compared as strings, so only YYYY-MM-DD will do
+	'''
+	try:
+		if re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+			datetime.datetime.strptime(value, '%Y-%m-%d')
+			return value
+	except ValueError:
+		pass
+	raise argparse.ArgumentTypeError('{!r} is not a date formatted YYYY-MM-DD'.format(value))
 
 def get_options():
 	parser = argparse.ArgumentParser(description='Join tweet texts into single file')
 	parser.add_argument('-i', dest='input', required=True, help='Input file as CSV where tweet data exists')
 	parser.add_argument('-o', dest='output', required=True, help='Output filename for results')
-	parser.add_argument('-s', '--start', dest='start_date', help='Start date for tweets, formatted YYYY-MM-DD', default=None)
-	parser.add_argument('-e', '--end', dest='end_date', help='End date for tweets, formatted YYYY-MM-DD')
+	parser.add_argument('-s', '--start', dest='start_date', type=date_type, help='Start date for tweets, formatted YYYY-MM-DD', default=None)
+	parser.add_argument('-e', '--end', dest='end_date', type=date_type, help='End date for tweets, formatted YYYY-MM-DD')
 	parser.add_argument('--hashtag', dest='hashtag', help='Hashtag to search for. Omit the leading #')
+	parser.add_argument('--mention', dest='mention', help='Only tweets mentioning this account. Omit the leading @')
+	parser.add_argument('--account', dest='account', help='Only tweets posted by this account')
+	parser.add_argument('--index', dest='index', help='Tweet index (.npz) to answer filters from; built if missing or out of date')
 	parser.add_argument('-c', '--clean', dest='clean', action='store_true', help='Remove all URLs and hashtags from tweet text before saving.')
 	return parser.parse_args()
 
-def read_tweet_data(filename):
-	with open(filename) as csvfile:
-		reader = csv.DictReader(csvfile, skipinitialspace=True, delimiter=',', quotechar="|")
-		tweet_data = [row for row in reader]
-	return tweet_data
-
-def get_date_tuple(string):
+def filter_by_date(batches, start, end):
 	'''
-	Get only the year, month, and day
-	Ignore time
+	Dates are compared as YYYY-MM-DD strings, so no tweet date is parsed
 	'''
-	return time.strptime(string[:10], '%Y-%m-%d')
-
-def filter_by_date(tweets, start, end):
-	if start is None and end is None:
-		return tweets
 	if start is None:
 		start = '1000-01-01'
-	start = get_date_tuple(start)
 	if end is None:
 		end = datetime.date.today().strftime('%Y-%m-%d')
-	end = get_date_tuple(end)
-	date_filtered_tweets = list()
-	for tweet in tweets:
-		created_at = get_date_tuple(tweet['created_at'])
-		if created_at >= start and created_at <= end:
-			date_filtered_tweets.append(tweet)
-	return date_filtered_tweets
+	return (tp.filter_batch(batch, start, end) for batch in batches)
 
-def filter_by_hashtag(tweets, hashtag):
-	return [tweet for tweet in tweets if '#' + hashtag.lower() in tweet['text'].lower()]
+def filter_by_hashtag(batches, hashtag):
+	return (tp.filter_batch(batch, hashtag=hashtag) for batch in batches)
 
-def clean_text(text):
-	# Remove URLs
-	text = re.sub('https?:\/{2}[\d\w-]+(\.[\d\w-]+)*(?:(?:\/[^\s/]*))*', '', text, flags=re.MULTILINE)
-	# Remove hash tags
-	text = re.sub('#\w+', '', text, flags=re.MULTILINE)
-	return text
+def filter_by_mention(batches, mention):
+	return (tp.filter_batch(batch, mention=mention) for batch in batches)
+
+def filter_by_account(batches, account):
+	return (tp.filter_batch(batch, account=account) for batch in batches)
+
+def query_index(options):
+	'''
+	Look up matching rows in the index and read only those
+	'''
+	start, end = options.start_date, options.end_date
+	if start or end:
+		start = start or '1000-01-01'
+		end = end or datetime.date.today().strftime('%Y-%m-%d')
+	index = ti.open_index(options.index, options.input)
+	rows = index.query(start, end, options.hashtag, options.mention, options.account)
+	return index.read_rows(rows)
 
-def write_text(tweets, filename, clean = False):
+def write_text(batches, filename, clean = False):
 	'''
 	Write out all words in tweets a single text file
 	'''
 	dirname = os.path.dirname(filename)
 	if len(dirname) and not os.path.isdir(dirname):
 		os.makedirs(dirname)
-	words = ''
-	for tweet in tweets:
-		text = tweet['text']
-		if clean:
-			text = clean_text(text)
-		words += text + '\n'
-	with open(filename, 'w') as f:
-		f.write(words)
+	with open(filename, 'w', buffering=1 << 20) as f:
+		for batch in batches:
+			f.write(tp.batch_text(batch, clean))
 
 def main():
 	'''
 	Process metadata
 	Organize by different slicings
+	Each step is a generator, so batches of tweets stream from input to output
+	With an index, only the matching rows are read
 	'''
 	options = get_options()
-	tweets = read_tweet_data(options.input)
+	if options.index:
+		write_text(query_index(options), options.output, options.clean)
+		return
+	tweets = tp.read_batches(options.input)
 	if options.start_date or options.end_date:
 		tweets = filter_by_date(tweets, options.start_date, options.end_date)
 	if options.hashtag:
 		tweets = filter_by_hashtag(tweets, options.hashtag)
+	if options.mention:
+		tweets = filter_by_mention(tweets, options.mention)
+	if options.account:
+		tweets = filter_by_account(tweets, options.account)
 	write_text(tweets, options.output, options.clean)
 
 
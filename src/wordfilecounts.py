@@ -6,45 +6,113 @@ import os
 import re
 import csv
 import sys
+import itertools
+import collections
 import pandas as pd
 import argparse
 import subcorpus as sc
 import wordfreqs as wf
 
+# Same word pattern as nltk's WordPunctTokenizer, minus punctuation runs
+word_pattern = re.compile(r'\w+')
+# Stands in for a missing value (undated file, blank author) while
+# grouping, since groupby drops NaN keys; written out as a blank
+MISSING = '\x00missing'
+
 
 def get_settings():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', dest='inputfile', required=True)
     parser.add_argument('-o', dest='outputfile', required=True)
-    parser.add_argument('-l', '--language', dest='language', required=True,
-                        help='Language in which the texts were written',
+    parser.add_argument('-l', '--language', dest='language', required=False,
+                        help='''Language in which the texts were written;
+                        accepted for compatibility, counting doesn't need it''',
                         choices=wf.lang_codes.keys(), type = str.lower)
     parser.add_argument('-c', dest='columns', required=True, action='append')
+    parser.add_argument('--stats-dir', dest='stats_dir', required=False,
+                        help='''Output directory of a previous wordfreqs.py run;
+                        reuse the word counts in its _stats files. Only stats
+                        from a run with -p and without -s are used, since
+                        otherwise they count punctuation or skip stopwords;
+                        other files are counted afresh''')
     return parser.parse_args()
 
 
-def count_words(filename, language):
-    text = wf.get_text_from_file(filename)
-    sentences = wf.tokenize_text(text, language, remove_punctuation=True)
-    return len(wf.wordlist(sentences))
-
-
-def write_rows(df, columns, csvfile, values=None):
-    for i, col in enumerate(columns):
-        for value in sc.get_uniques(df, col):
-            sub_df = df[df[col] == value]
-            row = {col: value, 'words': sub_df['words'].sum(), 'files': len(sub_df.index)}
-            if values is not None:
-                if 'words' in values:
-                    del values['words']
-                if 'files' in values:
-                    del values['files']
-                if col in values:
-                    del values[col]
-                row.update(values)
+def cached_count(filename, stats_dir):
+    '''
+    Return the word count wordfreqs.py stored for this file, if any
+    and if it was counted the way count_words counts: punctuation
+    removed (-p) and stopwords kept (no -s). Stats written before
+    wordfreqs recorded those settings are not used
+    '''
+    stats_file = wf.output_filename(stats_dir, filename + '_stats')
+    try:
+        stats = wf.read_stats(stats_file)
+        if (stats['remove_punctuation'] != 'True' or
+                stats['remove_stopwords'] != 'False'):
+            return None
+        return int(stats['words'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def count_words(filename, stats_dir=None):
+    '''
+    Count the words in a file without building token lists
+    Words are runs of \w characters, which is what wordfreqs -p counts
+    except for tokens that mix letters and punctuation
+    '''
+    if stats_dir is not None:
+        count = cached_count(filename, stats_dir)
+        if count is not None:
+            return count
+    count = 0
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                count += len(word_pattern.findall(line))
+    except (OSError, UnicodeDecodeError) as err:
+        print("Could not read {}: {}".format(filename, err))
+    return count
+
+
+def rollup(df, columns):
+    '''
+    Sum words and files for every ordered combination of columns
+    Groups the files once, then rolls the totals up from that table
+    Return a dict keyed by tuples of column indices; each value maps
+    the parent group's values to its child groups' (values, words, files)
+    '''
+    df = df[columns + ['words']].fillna(MISSING)
+    base = df.groupby(columns, sort=False)['words'].agg(['sum', 'count'])
+    totals = dict()
+    for size in range(1, len(columns) + 1):
+        for combo in itertools.combinations(range(len(columns)), size):
+            level = base.groupby(level=list(combo), sort=False).sum()
+            groups = collections.defaultdict(list)
+            for key, words, files in zip(level.index, level['sum'],
+                                         level['count']):
+                if not isinstance(key, tuple):
+                    key = (key,)
+                groups[key[:-1]].append((key, words, files))
+            totals[combo] = groups
+    return totals
+
+
+def write_rows(totals, columns, csvfile, combo=(), values=()):
+    '''
+    Write the totals depth-first, each group followed by its sub-groups
+    '''
+    start = combo[-1] + 1 if len(combo) else 0
+    for i in range(start, len(columns)):
+        child = combo + (i,)
+        for key, words, files in totals[child].get(values, []):
+            row = {columns[j]: '' if value == MISSING else value
+                   for j, value in zip(child, key)}
+            row.update({'words': words, 'files': files})
             csvfile.writerow(row)
-            if i < len(columns) - 1:
-                write_rows(sub_df, columns[i+1:], csvfile, row)
+            write_rows(totals, columns, csvfile, child, key)
+
 
 def main():
     settings = get_settings()
@@ -52,14 +120,14 @@ def main():
     df['year'] = df['date'].apply(sc.get_year)
     df['file_exists'] = df['filename'].apply(os.path.isfile)
     df = df.drop(df[df['file_exists'] == False].index)
-    df['words'] = df['filename'].apply(count_words, args=(settings.language,))
+    df['words'] = df['filename'].apply(count_words, args=(settings.stats_dir,))
 
     if not os.path.exists(os.path.dirname(settings.outputfile)):
         os.makedirs(os.path.dirname(settings.outputfile))
     with open(settings.outputfile, 'w') as f:
         csvfile = csv.DictWriter(f, fieldnames=settings.columns + ['words', 'files'])
         csvfile.writeheader()
-        write_rows(df, settings.columns, csvfile)
+        write_rows(rollup(df, settings.columns), settings.columns, csvfile)
 
 
 if __name__ == '__main__':
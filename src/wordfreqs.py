@@ -373,6 +373,16 @@ def write_stats(data, outfile):
         csvfile.writerow([data[key] for key in sorted_keys])
 
 
+def read_stats(infile):
+    '''
+    Read back the document-level stats written by write_stats
+    '''
+    with open(infile) as f:
+        for row in csv.DictReader(f, quotechar='|'):
+            return row
+    return dict()
+
+
 def gather_word_results(data):
     '''
     Convert multiple dictionaries of types of stats
@@ -456,6 +466,9 @@ def main():
     # Requires sentence-tokenized corpus for sentence-level statistics
     for filename, text in corpus_tokenized.items():
         stats = basic_stats(text)
+        # Record how words were counted, for tools that reuse the count
+        stats['remove_punctuation'] = settings.remove_punctuation
+        stats['remove_stopwords'] = settings.remove_stopwords
         if settings.pos:
             pos_percent = pos_percents(corpus_tagged[filename],
                                        wordfreqs[filename]['pos_raw_freq'])
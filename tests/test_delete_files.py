@@ -0,0 +1,38 @@
+import os
+import delete_files
+
+
+def make_tree(paths):
+    for path in paths:
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        open(path, 'w').close()
+
+
+def garbage(filenames):
+    directories = [os.path.dirname(f) for f in filenames]
+    keep = frozenset(os.path.normpath(f) for f in filenames)
+    return delete_files.find_garbage(delete_files.top_directories(directories), keep)
+
+
+def test_bare_filenames_do_not_walk_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_tree(['keep.txt', 'other.txt', 'sub/a.txt'])
+    files, directories = garbage(['keep.txt', 'sub/a.txt'])
+    assert files == []
+    assert directories == []
+
+
+def test_dot_prefixed_filenames_match(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_tree(['corpus/keep.txt', 'corpus/drop.txt', 'corpus/old/x.txt', './top.txt'])
+    files, directories = garbage(['./corpus/keep.txt', './top.txt'])
+    assert sorted(files) == [os.path.join('corpus', 'drop.txt'),
+                             os.path.join('corpus', 'old', 'x.txt')]
+    assert directories == [os.path.join('corpus', 'old')]
+
+
+def test_cwd_is_never_a_root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert delete_files.top_directories(['', '.', './', 'a', 'a/b']) == ['a']
@@ -0,0 +1,67 @@
+import os
+import csv
+import sys
+import argparse
+import threading
+import collections
+import pytest
+
+pytest.importorskip('requests')
+
+import facebook_extract
+import mock_graph_api
+
+FEEDS, POSTS, LINKS = 3, 40, 7
+
+
+@pytest.fixture
+def graph_api(monkeypatch):
+    '''
+    Run mock_graph_api on a free port, counting requests by path
+    Return its base URL and the counter
+    '''
+    requests = collections.Counter()
+    lock = threading.Lock()
+
+    class CountingHandler(mock_graph_api.GraphHandler):
+        def do_GET(self):
+            with lock:
+                requests[self.path.split('?')[0]] += 1
+            super().do_GET()
+
+    server = mock_graph_api.MockServer(('localhost', 0), CountingHandler)
+    port = server.server_address[1]
+    monkeypatch.setattr(mock_graph_api, 'settings', argparse.Namespace(
+        port=port, feeds=FEEDS, posts=POSTS, page_size=10, links=LINKS, latency=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://localhost:{}/'.format(port), requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_extract_from_mock(graph_api, tmp_path, monkeypatch):
+    url, requests = graph_api
+    output = str(tmp_path / 'out')
+    argv = ['facebook_extract.py', '-i', 'id', '-s', 'secret', '-o', output,
+            '--graph-url', url, '-j', '4']
+    for n in range(FEEDS):
+        argv += ['-f', 'feed{}'.format(n)]
+    monkeypatch.setattr(sys, 'argv', argv)
+    facebook_extract.main()
+
+    shared = [n for n in range(POSTS)
+              if mock_graph_api.statuses[n % len(mock_graph_api.statuses)]
+              in facebook_extract.shared_statuses]
+    for n in range(FEEDS):
+        with open(os.path.join(output, 'feed{}.csv'.format(n)), newline='') as f:
+            rows = list(csv.DictReader(f, quotechar='|'))
+        assert [row['id'] for row in rows] == ['feed{}_{}'.format(n, i) for i in shared]
+        assert all(row['message'] and row['link'] for row in rows)
+
+    # every link is shared by several posts and feeds, but fetched once
+    links = [path for path in requests if path.startswith('/links/')]
+    assert len(links) == LINKS
+    assert all(requests[path] == 1 for path in links)
+    host = url.split('//')[1].rstrip('/')
+    assert sorted(os.listdir(os.path.join(output, host, 'links'))) == \
+        sorted('{}.html'.format(n) for n in range(LINKS))
@@ -0,0 +1,100 @@
+import os
+import csv
+import json
+import pytest
+
+pytest.importorskip('tweepy')
+
+import get_tweets
+
+COLUMNS = ['id_str', 'text', 'created_at']
+
+
+class Interrupted(Exception):
+    pass
+
+
+class SmallPages(object):
+    '''
+    ReplayAPI with short pages, which can fail after a number of calls
+    '''
+    def __init__(self, directory, page_size=3, fail_after=None):
+        self.api = get_tweets.ReplayAPI(directory)
+        self.page_size = page_size
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def user_timeline(self, id, count=20, **kwargs):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise Interrupted()
+        return self.api.user_timeline(id, count=min(count, self.page_size), **kwargs)
+
+
+def record(directory, screen_name, ids):
+    with open(get_tweets.recording_filename(str(directory), screen_name), 'a') as f:
+        for i in ids:
+            f.write(json.dumps({'id': i, 'id_str': str(i), 'text': 'tweet {}'.format(i),
+                                'created_at': 'Sun Nov 01 00:00:00 +0000 2015'}) + '\n')
+
+
+def harvest(api, tmp_path, num=100, checkpoints=None):
+    output = str(tmp_path / 'tweets.csv')
+    checkpoints = checkpoints or get_tweets.Checkpoints(output + '.checkpoint.json')
+    with get_tweets.TweetWriter(output, ['name'] + COLUMNS) as writer:
+        harvester = get_tweets.Harvester(api, COLUMNS, writer, checkpoints,
+                                         get_tweets.RateLimiter(1000), num)
+        harvester.harvest('alice')
+
+
+def written_ids(tmp_path):
+    with open(str(tmp_path / 'tweets.csv'), newline='') as f:
+        return [int(row['id_str']) for row in csv.DictReader(f, quotechar='|')]
+
+
+def test_replay_resumes_with_only_new_tweets(tmp_path):
+    recordings = tmp_path / 'rec'
+    os.makedirs(str(recordings))
+    record(recordings, 'alice', range(1, 11))
+    harvest(SmallPages(str(recordings)), tmp_path, num=5)
+    assert written_ids(tmp_path) == [10, 9, 8, 7, 6]
+
+    record(recordings, 'alice', range(11, 16))
+    harvest(SmallPages(str(recordings)), tmp_path, num=10)
+    assert sorted(written_ids(tmp_path)) == list(range(1, 16))
+    assert len(written_ids(tmp_path)) == 15
+
+
+def test_interrupted_walk_is_resumed(tmp_path):
+    recordings = tmp_path / 'rec'
+    os.makedirs(str(recordings))
+    record(recordings, 'alice', range(1, 4))
+    harvest(SmallPages(str(recordings)), tmp_path, num=3)
+
+    # three pages of new tweets; fail after the first two
+    record(recordings, 'alice', range(4, 13))
+    with pytest.raises(Interrupted):
+        harvest(SmallPages(str(recordings), fail_after=2), tmp_path, num=3)
+    assert written_ids(tmp_path) == [3, 2, 1, 12, 11, 10, 9, 8, 7]
+
+    api = SmallPages(str(recordings))
+    harvest(api, tmp_path, num=3)
+    assert written_ids(tmp_path) == [3, 2, 1] + list(range(12, 3, -1))
+    assert api.calls == 2  # the last page, then the empty one ending the walk
+
+
+def test_crash_before_checkpoint_writes_no_duplicates(tmp_path, monkeypatch):
+    recordings = tmp_path / 'rec'
+    os.makedirs(str(recordings))
+    record(recordings, 'alice', range(1, 7))
+    checkpoints = get_tweets.Checkpoints(str(tmp_path / 'tweets.csv.checkpoint.json'))
+
+    def crash(screen_name, state):
+        raise Interrupted()
+    monkeypatch.setattr(checkpoints, 'update', crash)
+    with pytest.raises(Interrupted):
+        harvest(SmallPages(str(recordings)), tmp_path, num=6, checkpoints=checkpoints)
+    assert written_ids(tmp_path) == [6, 5, 4]
+
+    harvest(SmallPages(str(recordings)), tmp_path, num=6)
+    assert written_ids(tmp_path) == [6, 5, 4, 3, 2, 1]
@@ -0,0 +1,19 @@
+import os
+import unicodedata
+import inspect_corpus
+
+
+def test_normalised_collisions_are_duplicates(tmp_path):
+    composed = unicodedata.normalize('NFC', 'discours-élysée.txt')
+    decomposed = unicodedata.normalize('NFD', composed)
+    for name in [composed, decomposed, 'other.txt']:
+        open(os.path.join(str(tmp_path), name), 'w').close()
+    index = inspect_corpus.build_file_index(str(tmp_path), jobs=2)
+    assert len(index[os.path.join(str(tmp_path), composed)]) == 2
+
+    rows = [{'filename': os.path.join(str(tmp_path), composed)}]
+    results = inspect_corpus.check_corpus(rows, index)
+    assert results['missing'] == set()
+    assert results['extra'] == {os.path.join(str(tmp_path), 'other.txt')}
+    assert results['duplicates'] == {os.path.join(str(tmp_path), composed),
+                                     os.path.join(str(tmp_path), decomposed)}
@@ -0,0 +1,86 @@
+import os
+import csv
+import argparse
+import threading
+import pytest
+
+pytest.importorskip('bs4')
+pytest.importorskip('requests')
+
+import scraper
+import elysee
+import inatheque
+import fixture_server
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    '''
+    Start fixture_server on a free port for a directory of fixtures
+    Return the base URL
+    '''
+    servers = list()
+
+    def start(name):
+        monkeypatch.setattr(fixture_server, 'settings', argparse.Namespace(
+            directory=os.path.join(FIXTURES, name), latency=0, verbose=False))
+        server = fixture_server.FixtureServer(('localhost', 0), fixture_server.FixtureHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return 'http://localhost:{}'.format(server.server_address[1])
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def scrape(url, output_dir, cache_dir):
+    with scraper.Fetcher(cache_dir, jobs=4, per_host=2) as fetcher:
+        speeches = [elysee.get_page(page) for page in elysee.get_results(fetcher, url)]
+        stats = dict(fetcher.stats)
+    elysee.write_results(speeches, output_dir)
+    return speeches, stats
+
+
+def test_elysee_downloads_once(serve, tmp_path):
+    url = serve('elysee') + '/declarations/'
+    output_dir = str(tmp_path / 'out')
+    cache_dir = str(tmp_path / 'cache')
+
+    speeches, stats = scrape(url, output_dir, cache_dir)
+    assert len(speeches) == 4
+    assert stats.get('downloaded') == 6  # two listings, four speeches
+    assert not stats.get('revalidated')
+    with open(os.path.join(output_dir, 'metadata.csv')) as f:
+        rows = list(csv.DictReader(f, quotechar='|'))
+    assert len(set(row['filename'] for row in rows)) == 4
+    assert len([f for f in os.listdir(output_dir) if f.endswith('.txt')]) == 4
+    assert all(row['date'] and row['title'] for row in rows)
+
+    speeches, stats = scrape(url, output_dir, cache_dir)
+    assert len(speeches) == 4
+    assert not stats.get('downloaded')
+    assert stats.get('revalidated') == 6
+
+
+def test_speech_filenames_are_unique():
+    urls = ['http://www.elysee.fr/declarations/article/voeux-aux-francais/',
+            'http://www.elysee.fr/declarations/article-2/voeux-aux-francais/']
+    names = [elysee.speech_filename(url) for url in urls]
+    assert names[0] != names[1]
+    assert all(name.startswith('voeux-aux-francais-') for name in names)
+
+
+def test_inatheque_results(serve, tmp_path):
+    url = serve('inatheque') + '/results.html'
+    args = argparse.Namespace(url=[url, url], input_file=None, jobs=2, per_host=2,
+                              cache_dir=str(tmp_path / 'cache'))
+    results = [inatheque.parse_results(text) for text in inatheque.read_pages(args)]
+    assert len(results) == 2
+    headers, rows = results[0]
+    assert headers == ['Titre', 'Date de diffusion', 'Notice']
+    assert rows == [['Journal de 20 heures', '05/01/2014', '/Ina/notice/1'],
+                    ['Des paroles et des actes', '06/02/2014', '/Ina/notice/2']]